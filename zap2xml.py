@@ -1,23 +1,32 @@
 #!/usr/bin/env python3
 
 import argparse
+import calendar
 import os
 import sys
 import re
 import json
 import gzip
+import io
+import pickle
 import time
-from datetime import datetime, timezone
-import urllib.parse
-import urllib.request
-import requests
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
 import shutil
-import urllib3
-from functools import cmp_to_key
+from functools import lru_cache
+from operator import itemgetter
 from pathlib import Path
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 import traceback
 
+# orjson is optional; it is much faster on the multi-MB grid payloads
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
 VERSION = "2025-07-18"
 DEFAULT_DAYS = 7
 DEFAULT_NCDAYS = 0
@@ -28,42 +37,124 @@ DEFAULT_OUTFILE = 'xmltv.xml'
 DEFAULT_CACHE_DIR = 'cache'
 DEFAULT_LANG = 'en'
 DEFAULT_SLEEPTIME = 0
+DEFAULT_WORKERS = 8
+GZIP_BUFFER_SIZE = 128 * 1024
+GZIP_LEVEL = 1  # cache files are short-lived; favour speed over size
+
+# Config file keys: lowercased name -> (attribute, converter)
+CONFIG_KEYS = {
+    'start': ('start', int),
+    'days': ('days', int),
+    'ncdays': ('ncdays', int),
+    'ncsdays': ('ncsdays', int),
+    'ncmday': ('ncmday', int),
+    'retries': ('retries', int),
+    'threads': ('workers', int),
+    'user': ('userEmail', str),
+    'pass': ('password', str),
+    'cache': ('cacheDir', str),
+    'icon': ('iconDir', str),
+    'trailer': ('trailerDir', str),
+    'lang': ('lang', str),
+    'outfile': ('outFile', str),
+    'proxy': ('proxy', str),
+    'outformat': ('outputXTVD', str),
+    'lineupid': ('lineupId', str),
+    'lineupname': ('lineupname', str),
+    'lineuptype': ('lineuptype', str),
+    'lineuplocation': ('lineuplocation', str),
+    'postalcode': ('postalcode', str),
+}
+
+# Schedule slot 'flags' bits
+SLOT_NEW = 1
+SLOT_LIVE = 2
+SLOT_CC = 4
+SLOT_HD = 8
+
+# <new />, <live /> and <subtitles /> lines for each combination of those flags
+SLOT_TAGS = tuple(
+    ('\t\t<new />\n' if f & SLOT_NEW else '') +
+    ('\t\t<live />\n' if f & SLOT_LIVE else '') +
+    ('\t\t<subtitles type="teletext" />\n' if f & SLOT_CC else '')
+    for f in range(SLOT_HD)
+)
+
+# Bump when the parsed grid layout changes so older .pkl files are reparsed
+GRID_FORMAT = 2
+
+# Dicts every pickled grid has to carry to be merged
+GRID_SECTIONS = ('stations', 'schedule', 'programs', 'details')
+
+# tvguide CatId -> genre
+CATID_GENRES = {1: 'movie', 2: 'sports', 3: 'family', 4: 'news'}
+
+# Program id prefixes that can carry an original air date
+OAD_PREFIXES = frozenset(('EP', 'SH', 'MV'))
+
+# -E names and the XML escapes they enable; '&' has to be replaced first
+XML_ESCAPES = (
+    ('amp', '&', '&amp;'),
+    ('quot', '"', '&quot;'),
+    ('apos', "'", '&apos;'),
+    ('lt', '<', '&lt;'),
+    ('gt', '>', '&gt;'),
+)
+
+class EntityTable(dict):
+    """str.translate() table for -e: non-ASCII characters become &#N; references, filled in on first use."""
+    def __missing__(self, c):
+        v = self[c] = f'&#{c};' if c > 127 else c
+        return v
+
+ENTITY_TABLE = EntityTable()
 
 class Zap2XML:
     # ... __init__ and other methods ...  
     def pout(self, msg):
-        if not getattr(self, 'quiet', False):
+        if not self.quiet:
             print(msg, end='')
 
     def perr(self, msg):
         print(msg, file=sys.stderr, end='')
         
     def hour_to_millis(self):
-        now = datetime.now()
-        hour = 0 if hasattr(self, 'start') and self.start != 0 else (now.hour // self.gridHours) * self.gridHours
-        dt = datetime(now.year, now.month, now.day, hour, 0, 0)
-        timestamp = dt.timestamp()
+        now = time.localtime()
+        hour = 0 if self.start != 0 else (now.tm_hour // self.gridHours) * self.gridHours
+        timestamp = time.mktime((now.tm_year, now.tm_mon, now.tm_mday, hour, 0, 0, 0, 0, -1))
         
-        # Apply timezone adjustment ONLY if -g is NOT set
-        if not hasattr(self, 'g') or not self.g:
-            timestamp -= self.tz_offset() * 3600
+        # -g: no timezone adjustment, the local grid hour is taken as UTC
+        if self.g:
+            timestamp += self.tz_offset(timestamp) * 3600
         
         return int(timestamp * 1000)
 
     def tz_offset(self, t=None):
         """Calculate timezone offset in hours (UTC-aware)."""
-        t = t or time.time()
-        local = datetime.fromtimestamp(t).astimezone()  # Local time with TZ
-        utc = datetime.fromtimestamp(t, tz=timezone.utc)  # UTC time
-        return (local - utc).total_seconds() / 3600
+        return time.localtime(t if t is not None else time.time()).tm_gmtoff / 3600
         
+    def init_encoding_flags(self):
+        # Resolve the output options once; enc() runs for every string written
+        sel = self.encodeSelective
+        self.encLatin1 = not self.utf8
+        self.encXml = tuple((c, e) for name, c, e in XML_ESCAPES if sel is None or name in sel)
+        self.encEntities = bool(self.encodeEntities)
+        # Slot flags that get " *" appended to the title (-A)
+        asterisk = self.appendAsterisk or ''
+        self.asteriskFlags = (SLOT_NEW if 'new' in asterisk else 0) | (SLOT_LIVE if 'live' in asterisk else 0)
+
     def write_output_file(self):
         self.pout(f"Writing XML file: {self.outFile}\n")
-        encoding = 'utf-8' if getattr(self, 'utf8', False) else 'iso-8859-1'
+        self.init_encoding_flags()
+        self.chanIds = None
+        self.stationOrder = None
+        self.programmeXml.clear()
+        encoding = 'utf-8' if self.utf8 else 'iso-8859-1'
 
         try:
-            with Path(self.outFile).open('w', encoding=encoding) as f:
-                if getattr(self, 'outputXTVD', False):
+            # Large buffer: the print_* methods issue many small writes
+            with open(self.outFile, 'w', encoding=encoding, buffering=1 << 20) as f:
+                if self.outputXTVD:
                     self.print_header_xtvd(f, encoding)
                     self.print_stations_xtvd(f)
                     self.print_lineups_xtvd(f)
@@ -75,39 +166,46 @@ class Zap2XML:
                     self.print_header(f, encoding)
                     self.print_channels(f)
 
-                    if getattr(self, 'includeXMLTV', None):
+                    if self.includeXMLTV:
                         self.pout(f"Reading XML file: {self.includeXMLTV}")
-                        self.inc_xml("<channel", "<programme", f)
+                        self.inc_xml(f, "<channel", "<programme")
 
                     self.print_programmes(f)
 
-                    if getattr(self, 'includeXMLTV', None):
-                        self.inc_xml("<programme", "</tv", f)
+                    if self.includeXMLTV:
+                        self.inc_xml(f, "<programme", "</tv")
 
                     self.print_footer(f)
         except OSError as e:
             self.perr(f"Failed to write output file: {e}")
             raise
 
-    def conv_time(self, t):
-        dt_utc = datetime.fromtimestamp(t / 1000, tz=timezone.utc)
-        dt_local = dt_utc.astimezone()
-        return dt_local.strftime('%Y%m%d%H%M%S')
-
-    def conv_time_xtvd(self, t):
-        dt_utc = datetime.fromtimestamp(t / 1000, tz=timezone.utc)
-        dt_local = dt_utc.astimezone()
-        return dt_local.strftime('%Y-%m-%dT%H:%M:%SZ')
-
-    def conv_oad(self, t):
-        dt_utc = datetime.fromtimestamp(t // 1000, tz=timezone.utc)
-        dt_local = dt_utc.astimezone()
-        return dt_local.strftime('%Y%m%d')
-
-    def conv_oad_xtvd(self, t):
-        dt_utc = datetime.fromtimestamp(t // 1000, tz=timezone.utc)
-        dt_local = dt_utc.astimezone()
-        return dt_local.strftime('%Y-%m-%d')
+    @staticmethod
+    @lru_cache(maxsize=65536)
+    def conv_time(t):
+        dt = datetime.fromtimestamp(t / 1000)
+        return f"{dt.year:04d}{dt.month:02d}{dt.day:02d}{dt.hour:02d}{dt.minute:02d}{dt.second:02d}"
+
+    @staticmethod
+    @lru_cache(maxsize=65536)
+    def conv_time_xtvd(t):
+        return datetime.fromtimestamp(t / 1000).isoformat(timespec='seconds') + 'Z'
+
+    @staticmethod
+    def conv_duration_xtvd(duration):
+        hours, minutes = divmod(duration // 60000, 60)
+        return f"PT{hours:02d}H{minutes:02d}M"
+
+    @staticmethod
+    @lru_cache(maxsize=65536)
+    def conv_oad(t):
+        dt = datetime.fromtimestamp(t // 1000)
+        return f"{dt.year:04d}{dt.month:02d}{dt.day:02d}"
+
+    @staticmethod
+    @lru_cache(maxsize=65536)
+    def conv_oad_xtvd(t):
+        return date.fromtimestamp(t // 1000).isoformat()
     
     def get_timezone_offset_str(self, t=None):
         """
@@ -115,19 +213,16 @@ class Zap2XML:
         If `t` is None, uses the current time.
         """
         if t is None:
-            dt = datetime.now()
-        else:
-            dt = datetime.fromtimestamp(t // 1000)
-
-        # Get offset as timedelta
-        offset = dt.astimezone().utcoffset()
-        if offset is None:
-            return "+0000"  # fallback, shouldn't happen
-
-        total_minutes = int(offset.total_seconds() // 60)
+            t = time.time() * 1000
+        # UTC offsets only change on quarter-hour boundaries
+        return self.quarter_offset_str(int(t) // 900000)
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def quarter_offset_str(quarter):
+        total_minutes = time.localtime(quarter * 900).tm_gmtoff // 60
         sign = "+" if total_minutes >= 0 else "-"
-        hours = abs(total_minutes) // 60
-        minutes = abs(total_minutes) % 60
+        hours, minutes = divmod(abs(total_minutes), 60)
         return f"{sign}{hours:02d}{minutes:02d}"
 
     def __init__(self):
@@ -149,6 +244,7 @@ class Zap2XML:
         self.lineupId = None
         self.device = None
         self.sleeptime = DEFAULT_SLEEPTIME
+        self.workers = DEFAULT_WORKERS
         self.allChan = False
         self.shiftMinutes = 0
         self.outputXTVD = False
@@ -157,10 +253,24 @@ class Zap2XML:
         self.lineuplocation = None
         self.zapToken = None
         self.zapPref = '-'
-        self.zapFavorites = {}
+        self.zapFavorites = set()
+        self.zapParams = None
+        self.zapParamsKey = None
         self.sidCache = {}
+        self.details = {}  # cp -> details URL (tvguide) or series id (gracenote)
+        self.chanIds = None  # station key -> channel id, set by channel_ids
+        self.stationOrder = None  # station keys in channel order, set by sorted_stations
+        self.programmeXml = {}  # cp -> per-program <programme> parts, filled by programme_xml
         self.sTBA = r"\bTBA\b|To Be Announced"
-        self.tvgfavs = {}
+        self.reTBA = re.compile(self.sTBA, re.I)
+        # Titles containing none of the literal words in sTBA can skip the regex
+        words = [w.replace(r'\b', '') for w in self.sTBA.split('|')]
+        self.tbaWords = tuple(w.casefold() for w in words) if all(re.fullmatch(r'[\w ]+', w) for w in words) else None
+        self.reEAD = re.compile(r'[^0-9-]')
+        self.reThumbQuery = re.compile(r'\?.*')
+        self.reSpriteBG = re.compile(r'background-image:.+?url\((.+?)\)')
+        self.reSpriteIcon = re.compile(r'listings-channel-icon-(.+?)\{.+?position:.*?-(\d+).+?(\d+).*?\}', re.I)
+        self.tvgfavs = set()
         self.programs = {}
         self.stations = {}
         self.schedule = {}
@@ -168,9 +278,9 @@ class Zap2XML:
         self.coNum = 0
         self.tb = 0
         self.treq = 0
+        self.statsLock = threading.Lock()
         self.tsocks = set()
         self.expired = 0
-        self.ua = None
         self.tba = 0
         self.exp = 0
         self.XTVD_startTime = None
@@ -186,7 +296,33 @@ class Zap2XML:
         self.zlineupId = None  # Add this with other attributes
         self.session = None  # Add this line with other attribute initializations
         self.zipcode = None
-        
+
+        # Command-line only options; parse_options() skips unset values
+        self.quiet = False
+        self.waitOnExit = False
+        self.g = False
+        self.utf8 = False
+        self.includeXMLTV = None
+        self.iconDir = None
+        self.trailerDir = None
+        self.noTbaCache = False
+        self.retainOrder = False
+        self.seriesCategory = False
+        self.includeDetails = False
+        self.includeIcons = False
+        self.channelNamesFirst = False
+        self.oldStyleIds = False
+        self.movieSubtitle = False
+        self.liveTag = False
+        self.appendAsterisk = None
+        self.encodeEntities = False
+        self.encodeSelective = None
+        self.opt8 = False
+        self.opt9 = False
+        self.R = False
+        self.W = False
+        self.init_encoding_flags()
+
         # Determine home directory and config file path
         self.homeDir = os.path.expanduser('~')
         if not self.homeDir:
@@ -212,8 +348,11 @@ class Zap2XML:
         # Print completion stats
         ts = sum(len(sched) for sched in self.schedule.values())
         self.pout(f"Completed with {len(self.stations)} stations, {len(self.programs)} programs, {ts} scheduled\n")
+
+        for conv in (self.conv_time, self.conv_time_xtvd, self.conv_oad, self.conv_oad_xtvd):
+            conv.cache_clear()
         
-        if hasattr(self, 'waitOnExit') and self.waitOnExit:
+        if self.waitOnExit:
             input("Press ENTER to exit:")
         elif sys.platform == 'win32':
             time.sleep(3)
@@ -250,6 +389,7 @@ class Zap2XML:
         parser.add_argument("-P", "--proxy", dest="proxy", help="http proxy (http://proxyhost:port)")
         parser.add_argument("-r", "--retries", type=int, dest="retries", help=f"connection retries (default={DEFAULT_RETRIES}, max 20)")
         parser.add_argument("-S", "--sleep", type=int, dest="sleeptime", help=f"sleep between requests (default={DEFAULT_SLEEPTIME})")
+        parser.add_argument("-t", "--threads", type=int, dest="workers", help=f"parallel grid downloads (default={DEFAULT_WORKERS}, 1 when -S is set)")
         
         # Content options
         parser.add_argument("-l", "--lang", dest="lang", help=f"language (default={DEFAULT_LANG})")
@@ -291,112 +431,29 @@ class Zap2XML:
             with open(self.confFile, 'r') as f:
                 self.pout(f"Reading config file: {self.confFile}\n")
                 for line in f:
-                    line = line.split('#')[0].strip()  # Remove comments
+                    line = line.partition('#')[0].strip()  # Remove comments
                     if not line:
                         continue
-                    
-                    match = re.match(r'^\s*start\s*=\s*(\d+)', line, re.I)
-                    if match:
-                        self.start = int(match.group(1))
-                        continue
-                        
-                    match = re.match(r'^\s*days\s*=\s*(\d+)', line, re.I)
-                    if match:
-                        self.days = int(match.group(1))
-                        continue
-                        
-                    match = re.match(r'^\s*ncdays\s*=\s*(\d+)', line, re.I)
-                    if match:
-                        self.ncdays = int(match.group(1))
-                        continue
-                        
-                    match = re.match(r'^\s*ncsdays\s*=\s*(\d+)', line, re.I)
-                    if match:
-                        self.ncsdays = int(match.group(1))
-                        continue
-                        
-                    match = re.match(r'^\s*ncmday\s*=\s*(\d+)', line, re.I)
-                    if match:
-                        self.ncmday = int(match.group(1))
-                        continue
-                        
-                    match = re.match(r'^\s*retries\s*=\s*(\d+)', line, re.I)
-                    if match:
-                        self.retries = int(match.group(1))
-                        continue
-                        
-                    match = re.match(r'^\s*user[\w\s]*=\s*(.+)', line, re.I)
-                    if match:
-                        self.userEmail = self.rtrim(match.group(1))
-                        continue
-                        
-                    match = re.match(r'^\s*pass[\w\s]*=\s*(.+)', line, re.I)
-                    if match:
-                        self.password = self.rtrim(match.group(1))
-                        continue
-                        
-                    match = re.match(r'^\s*cache\s*=\s*(.+)', line, re.I)
-                    if match:
-                        self.cacheDir = self.rtrim(match.group(1))
-                        continue
-                        
-                    match = re.match(r'^\s*icon\s*=\s*(.+)', line, re.I)
-                    if match:
-                        self.iconDir = self.rtrim(match.group(1))
-                        continue
-                        
-                    match = re.match(r'^\s*trailer\s*=\s*(.+)', line, re.I)
-                    if match:
-                        self.trailerDir = self.rtrim(match.group(1))
-                        continue
-                        
-                    match = re.match(r'^\s*lang\s*=\s*(.+)', line, re.I)
-                    if match:
-                        self.lang = self.rtrim(match.group(1))
-                        continue
-                        
-                    match = re.match(r'^\s*outfile\s*=\s*(.+)', line, re.I)
-                    if match:
-                        self.outFile = self.rtrim(match.group(1))
-                        continue
-                        
-                    match = re.match(r'^\s*proxy\s*=\s*(.+)', line, re.I)
-                    if match:
-                        self.proxy = self.rtrim(match.group(1))
-                        continue
-                        
-                    match = re.match(r'^\s*outformat\s*=\s*(.+)', line, re.I)
-                    if match:
-                        if re.search(r'xtvd', match.group(1), re.I):
+
+                    key, sep, value = line.partition('=')
+                    key = key.strip().lower()
+                    value = value.strip()
+                    words = key.split()
+                    if words and words[0].startswith(('user', 'pass')):
+                        key = 'user' if words[0].startswith('user') else 'pass'
+                    entry = CONFIG_KEYS.get(key)
+                    if not sep or not value or entry is None:
+                        raise Exception(f"Odd line in config file \"{self.confFile}\".\n\t{line}")
+
+                    attr, conv = entry
+                    if attr == 'outputXTVD':
+                        if 'xtvd' in value.lower():
                             self.outputXTVD = True
                         continue
-                        
-                    match = re.match(r'^\s*lineupid\s*=\s*(.+)', line, re.I)
-                    if match:
-                        self.lineupId = self.rtrim(match.group(1))
-                        continue
-                        
-                    match = re.match(r'^\s*lineupname\s*=\s*(.+)', line, re.I)
-                    if match:
-                        self.lineupname = self.rtrim(match.group(1))
-                        continue
-                        
-                    match = re.match(r'^\s*lineuptype\s*=\s*(.+)', line, re.I)
-                    if match:
-                        self.lineuptype = self.rtrim(match.group(1))
-                        continue
-                        
-                    match = re.match(r'^\s*lineuplocation\s*=\s*(.+)', line, re.I)
-                    if match:
-                        self.lineuplocation = self.rtrim(match.group(1))
-                        continue
-                        
-                    match = re.match(r'^\s*postalcode\s*=\s*(.+)', line, re.I)
-                    if match:
-                        self.postalcode = self.rtrim(match.group(1))
-                        continue
-                        
-                    raise Exception(f"Odd line in config file \"{self.confFile}\".\n\t{line}")
+                    try:
+                        setattr(self, attr, conv(value))
+                    except ValueError:
+                        raise Exception(f"Odd line in config file \"{self.confFile}\".\n\t{line}")
         except IOError:
             pass
             
@@ -413,109 +470,335 @@ class Zap2XML:
         self.ncdays = self.days - self.ncdays  # Make relative to the end
 
     def clean_old_cache_files(self):
-        for filename in os.listdir(self.cacheDir):
-            if filename.endswith('.html') or filename.endswith('.js'):
-                filepath = os.path.join(self.cacheDir, filename)
-                atime = os.path.getatime(filepath)
-                if atime + ((self.days + 2) * 86400) < time.time():
-                    self.pout(f"Deleting old cached file: {filepath}\n")
+        # NOTE: grid/details caches are written as .js.gz, which this filter
+        # (kept from the original script) does not match. The .pkl and .etag
+        # sidecars of the grid files are expired here, as new runs use new slot times.
+        now = time.time()
+        max_age = (self.days + 2) * 86400
+        with os.scandir(self.cacheDir) as it:
+            for entry in it:
+                name = entry.name
+                if not name.endswith(('.html', '.js', '.pkl', '.etag')):
+                    continue
+                if entry.stat().st_atime + max_age < now:
+                    self.pout(f"Deleting old cached file: {entry.path}\n")
                     try:
-                        os.unlink(filepath)
+                        os.unlink(entry.path)
                     except OSError as e:
-                        self.perr(f"Failed to delete '{filepath}': {e}\n")
+                        self.perr(f"Failed to delete '{entry.path}': {e}\n")
 
     def process_data(self):
-        if self.useTVGuide:
-            if not self.allChan:
-                self.login()  # Get favorites
-            if hasattr(self, 'iconDir') and self.iconDir:
-                self.parse_tvg_icons()
-                
-            max_count = self.days * (24 // self.gridHours)
-            offset = self.start * 3600 * 24 * 1000
-            ms = self.hour_to_millis() + offset
-            
-            for count in range(max_count):
-                curday = (count // (24 // self.gridHours)) + 1
+        if not self.allChan:
+            self.login()  # Get favorites
+        if self.useTVGuide and self.iconDir:
+            self.parse_tvg_icons()
+
+        plan = self.plan_grid_slots()
+        if any(url for _, _, _, url in plan):
+            if self.useTVGuide and not self.zlineupId:
+                self.login()
+                plan = self.plan_grid_slots()
+            elif self.session is None:
+                self.login()  # Create the session before fanning out to the workers
+        parse = self.parse_tvg_grid if self.useTVGuide else self.parse_json
+
+        # Fetch uncached slots concurrently, parse them serially in slot order.
+        # At most one slot per worker is queued ahead, so an empty response
+        # ("server out of data") stops the fetching as well as the parsing.
+        workers = self.worker_count()
+        executor = ThreadPoolExecutor(max_workers=workers)
+        try:
+            queued = deque(executor.submit(self.fetch_grid_slot, slot) for slot in plan[:workers])
+            for n, (count, ms, fn, url) in enumerate(plan):
                 if count == 0:
                     self.XTVD_startTime = ms
-                elif count == max_count - 1:
+                elif count == len(plan) - 1:
                     self.XTVD_endTime = ms + (self.gridHours * 3600000) - 1
-                    
-                fn = os.path.join(self.cacheDir, f"{ms}.js.gz")
-                if (not os.path.exists(fn)) or (curday > self.ncdays) or (curday <= self.ncsdays) or (curday == self.ncmday):
-                    if not self.zlineupId:
-                        self.login()
-                    duration = self.gridHours * 60
-                    tvgstart = str(ms)[:-3]
-                    rs = self.get_url(f"{self.tvgurlRoot}Listingsweb/ws/rest/schedules/{self.zlineupId}/start/{tvgstart}/duration/{duration}", True)
-                    if not rs:
-                        break
-                    self.write_binary_file(fn, gzip.compress(rs.encode('utf-8')))
-                
-                self.pout(f"[{count+1}/{max_count}] Parsing: {fn}\n")
-                self.parse_tvg_grid(fn)
-                
-                if hasattr(self, 'noTbaCache') and self.noTbaCache and self.tba:
+
+                if not queued.popleft().result():
+                    break
+                if n + workers < len(plan):
+                    queued.append(executor.submit(self.fetch_grid_slot, plan[n + workers]))
+
+                self.pout(f"[{count+1}/{len(plan)}] Parsing: {fn}\n")
+                self.parse_grid_file(parse, fn)
+
+                if self.noTbaCache and self.tba:
                     self.pout(f"Deleting: {fn} (contains \"{self.sTBA}\")\n")
-                    self.unlink_file(fn)
+                    self.unlink_grid_file(fn)
                 if self.exp:
                     self.pout(f"Deleting: {fn} (expired)\n")
-                    self.unlink_file(fn)
-                    
+                    self.unlink_grid_file(fn)
+
                 self.exp = 0
                 self.tba = 0
-                ms += self.gridHours * 3600 * 1000
+
+            # Drop grid slots still queued after an early stop so the detail
+            # downloads do not wait behind them
+            for future in queued:
+                future.cancel()
+            self.fetch_details(executor)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def plan_grid_slots(self):
+        """Returns (count, ms, fn, url) for every grid slot; url is None when the cached file can be used."""
+        max_count = self.days * (24 // self.gridHours)
+        offset = self.start * 3600 * 24 * 1000
+        ms = self.hour_to_millis() + offset
+
+        duration = self.gridHours * 60
+        zap_params = None  # built on first use; may need a login
+
+        plan = []
+        for count in range(max_count):
+            curday = (count // (24 // self.gridHours)) + 1
+            fn = os.path.join(self.cacheDir, f"{ms}.js.gz")
+            url = None
+            if (not os.path.exists(fn)) or (curday > self.ncdays) or (curday <= self.ncsdays) or (curday == self.ncmday):
+                if self.useTVGuide:
+                    url = f"{self.tvgurlRoot}Listingsweb/ws/rest/schedules/{self.zlineupId}/start/{ms // 1000}/duration/{duration}"
+                else:
+                    if zap_params is None:
+                        g_params = self.get_zap_g_params()
+                        zap_params = (f"pref={self.zapPref}&{g_params}"
+                                      '&TMSID=&AffiliateID=orbebb&FromPage=TV%20Grid'
+                                      '&ActivityID=1&OVDID=&isOverride=true')
+                    url = f"{self.urlRoot}api/grid?time={ms // 1000}&timespan={self.gridHours}&{zap_params}"
+
+            plan.append((count, ms, fn, url))
+            ms += self.gridHours * 3600 * 1000
+        return plan
+
+    def fetch_grid_slot(self, slot):
+        """Downloads one planned grid slot into the cache. Runs on a worker thread."""
+        count, ms, fn, url = slot
+        if url is None:
+            return True
+
+        # Refetched slots revalidate the cached copy with its ETag
+        etag_fn = fn + '.etag'
+        validators = {}
+        if os.path.exists(fn):
+            try:
+                validators['etag'] = Path(etag_fn).read_text().strip()
+            except OSError:
+                pass
+
+        rs = self.get_url(url, True, validators)
+        if rs is None:
+            self.touch_grid_file(fn)
+            return True
+        if not rs:
+            return False
+        self.write_gzip_file(fn, rs)
+        try:
+            if validators.get('etag'):
+                Path(etag_fn).write_text(validators['etag'])
+            elif os.path.exists(etag_fn):
+                os.unlink(etag_fn)
+        except OSError as e:
+            self.perr(f"Failed to write '{etag_fn}': {e}\n")
+        return True
+
+    def touch_grid_file(self, fn):
+        # Keep an up-to-date pickle ahead of the file it was parsed from
+        pkl = fn + '.pkl'
+        try:
+            fresh = os.path.getmtime(pkl) >= os.path.getmtime(fn)
+        except OSError:
+            fresh = False
+        try:
+            os.utime(fn)
+            if fresh:
+                os.utime(pkl)
+        except OSError as e:
+            self.perr(f"Failed to touch '{fn}': {e}\n")
+
+    def parse_grid_file(self, parse, fn):
+        """
+        Parses a grid file into stations/schedule/programs. The parsed result is
+        pickled next to the file and reused on later runs while it is still
+        newer than the file and was produced with the same options.
+        """
+        pkl = fn + '.pkl'
+        key = self.grid_cache_key()
+        try:
+            if os.path.getmtime(pkl) >= os.path.getmtime(fn):
+                with open(pkl, 'rb') as f:
+                    grid = pickle.load(f)
+                # A pickle from an older layout is reparsed rather than merged
+                if (grid.get('key') == key and 'tba' in grid and
+                        all(isinstance(grid.get(k), dict) for k in GRID_SECTIONS)):
+                    self.merge_grid(grid)
+                    return
+        except (OSError, EOFError, AttributeError, pickle.UnpicklingError):
+            pass
+
+        # Parse into empty containers so the pickle holds only this file's data
+        saved = (self.stations, self.schedule, self.programs, self.details, self.coNum)
+        self.stations, self.schedule, self.programs, self.details, self.coNum = {}, {}, {}, {}, 0
+        try:
+            ok = parse(fn)
+            grid = {
+                'key': key,
+                'stations': self.stations,
+                'schedule': self.schedule,
+                'programs': self.programs,
+                'details': self.details,
+                'tba': self.tba
+            }
+        finally:
+            self.stations, self.schedule, self.programs, self.details, self.coNum = saved
+
+        if ok:
+            try:
+                with open(pkl, 'wb') as f:
+                    pickle.dump(grid, f, pickle.HIGHEST_PROTOCOL)
+            except (OSError, pickle.PicklingError) as e:
+                self.perr(f"Failed to write '{pkl}': {e}\n")
+        self.merge_grid(grid)
+
+    def grid_cache_key(self):
+        # Everything that changes what the grid parsers keep
+        favs = self.tvgfavs if self.useTVGuide else self.zapFavorites
+        return (
+            VERSION, GRID_FORMAT, self.useTVGuide, self.allChan, tuple(sorted(favs)),
+            self.retainOrder, self.seriesCategory, self.opt8,
+            self.includeDetails, self.includeIcons, self.W, self.iconDir
+        )
+
+    def merge_grid(self, grid):
+        for cs, station in grid['stations'].items():
+            if cs not in self.stations:
+                if self.retainOrder:
+                    station['order'] = self.coNum
+                self.stations[cs] = station
+                self.coNum += 1
+
+        for cs, slots in grid['schedule'].items():
+            self.schedule.setdefault(cs, {}).update(slots)
+
+        for cp, prog in grid['programs'].items():
+            cur = self.programs.get(cp)
+            if cur is None:
+                self.programs[cp] = prog
+                continue
+            for k, v in prog.items():
+                old = cur.get(k)
+                if isinstance(v, dict) and isinstance(old, dict):
+                    old.update(v)
+                elif k == 'originalAirDate' and isinstance(v, int) and isinstance(old, int):
+                    cur[k] = min(old, v)
+                else:
+                    cur[k] = v
+
+        for cp, arg in grid['details'].items():
+            self.details.setdefault(cp, arg)
+
+        if grid['tba']:
+            self.tba = 1
+
+    def fetch_details(self, executor):
+        """
+        Downloads the detail files queued by the grid parsers on the executor,
+        then parses them serially in queue order so that only the main thread
+        touches self.programs.
+        """
+        details, self.details = self.details, {}
+        if not details:
+            return
+
+        # One stat per file; empty files left by failed writes count as missing
+        if self.useTVGuide:
+            files = {cp: os.path.join(self.cacheDir, f"{cp}.js.gz") for cp in details}
+            ready = {cp: self.file_size(fn) > 0 for cp, fn in files.items()}
+            jobs = [cp for cp, ok in ready.items() if not ok]
+            if jobs and self.session is None:
+                self.login()
+            for cp, ok in zip(jobs, executor.map(self.fetch_details_file, [(files[cp], details[cp]) for cp in jobs])):
+                ready[cp] = ok
+            parse = self.parse_tvg_details
         else:
-            if not self.allChan:
-                self.login()  # Get favorites
-                
-            max_count = self.days * (24 // self.gridHours)
-            offset = self.start * 3600 * 24 * 1000
-            ms = self.hour_to_millis() + offset
-            
-            for count in range(max_count):
-                curday = (count // (24 // self.gridHours)) + 1
-                if count == 0:
-                    self.XTVD_startTime = ms
-                elif count == max_count - 1:
-                    self.XTVD_endTime = ms + (self.gridHours * 3600000) - 1
-                    
-                fn = os.path.join(self.cacheDir, f"{ms}.js.gz")
-                if (not os.path.exists(fn)) or (curday > self.ncdays) or (curday <= self.ncsdays) or (curday == self.ncmday):
-                    zstart = str(ms)[:-3]
-                    params = f"?time={zstart}&timespan={self.gridHours}&pref={self.zapPref}&"
-                    params += self.get_zap_g_params()
-                    params += '&TMSID=&AffiliateID=orbebb&FromPage=TV%20Grid'
-                    params += '&ActivityID=1&OVDID=&isOverride=true'
-                    rs = self.get_url(f"{self.urlRoot}api/grid{params}", True)
-                    if not rs:
-                        break
-                    self.write_binary_file(fn, gzip.compress(rs.encode('utf-8')))
-                
-                self.pout(f"[{count+1}/{max_count}] Parsing: {fn}\n")
-                self.parse_json(fn)
-                
-                if hasattr(self, 'noTbaCache') and self.noTbaCache and self.tba:
-                    self.pout(f"Deleting: {fn} (contains \"{self.sTBA}\")\n")
-                    self.unlink_file(fn)
-                if self.exp:
-                    self.pout(f"Deleting: {fn} (expired)\n")
-                    self.unlink_file(fn)
-                    
-                self.exp = 0
-                self.tba = 0
-                ms += self.gridHours * 3600 * 1000
+            files = {cp: os.path.join(self.cacheDir, f"O{cp}.js.gz") for cp in details}
+            # Series share one overview; post it once and copy it for the others
+            ready = {}
+            jobs = {}
+            for cp, sid in details.items():
+                fn = files[cp]
+                ready[cp] = self.file_size(fn) > 0
+                if not ready[cp]:
+                    if sid in self.sidCache:
+                        shutil.copyfile(self.sidCache[sid], fn)
+                        ready[cp] = True
+                    elif sid not in jobs:
+                        jobs[sid] = (cp, fn, sid)
+            if jobs:
+                if self.session is None:
+                    self.login()
+                self.get_zap_params()  # build once before fanning out
+            for (cp, fn, sid), ok in zip(jobs.values(), executor.map(self.post_json_overview, jobs.values())):
+                if ok:
+                    self.sidCache[sid] = fn
+                    ready[cp] = True
+            for cp, sid in details.items():
+                if not ready[cp] and sid in self.sidCache:
+                    shutil.copyfile(self.sidCache[sid], files[cp])
+                    ready[cp] = True
+            parse = self.parse_json_overview
+
+        for cp, fn in files.items():
+            if ready[cp]:
+                self.pout(f"[D] Parsing: {cp}\n")
+                self.cp = cp
+                parse(fn)
+            else:
+                self.pout(f"Skipping: {cp}\n")
+
+    def fetch_details_file(self, job):
+        fn, url = job
+        rs = self.get_url(url, True)
+        if not rs:
+            return False
+        self.write_gzip_file(fn, rs)
+        return True
+
+    def file_size(self, filename):
+        try:
+            return os.stat(filename).st_size
+        except FileNotFoundError:
+            return 0
+
+    def worker_count(self):
+        # Honour -S: throttled runs keep requests strictly sequential
+        if self.sleeptime:
+            return 1
+        return max(1, min(self.workers, 32))
 
     def login(self):
         if self.session is None:
+            # The network stack is only imported once it is actually needed
+            import requests
+            import urllib3
+            urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
             # Initialize session with SSL verification disabled
             self.session = requests.Session()
             self.session.verify = False
             self.session.headers.update({
                 'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64; rv:130.0) Gecko/20100101 Firefox/130.0', 
-                'Accept-Encoding': 'gzip'
+                'Accept-Encoding': 'gzip',
+                'Connection': 'keep-alive'
             })
+            # One keep-alive connection per worker; get_url does its own retries
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=4,
+                pool_maxsize=self.worker_count(),
+                pool_block=True,
+                max_retries=0
+            )
+            self.session.mount('https://', adapter)
+            self.session.mount('http://', adapter)
             if self.proxy:
                 self.session.proxies = {
                     'http': self.proxy,
@@ -523,13 +806,13 @@ class Zap2XML:
                 }
         
         # login logic
-        if (not self.userEmail or not self.password) and not hasattr(self, 'zlineupId'):
+        if (not self.userEmail or not self.password) and not self.zlineupId:
             raise Exception("Unable to login: Unspecified username or password")
 
         if self.userEmail and self.password:
             self.pout(f"Logging in as \"{self.userEmail}\" ({time.strftime('%c')})\n")
             try:
-                if hasattr(self, 'useTVGuide') and self.useTVGuide:
+                if self.useTVGuide:
                     return self.login_tvg()
                 return self.login_zap()
             except Exception as e:
@@ -537,6 +820,7 @@ class Zap2XML:
                 raise
 
     def login_tvg(self):
+        import requests
         rc = 0
         while rc < self.retries:
             rc += 1
@@ -561,17 +845,17 @@ class Zap2XML:
                 
                 if 'success' in r.text:
                     # Extract lineup ID from cookies if not already set
-                    if not hasattr(self, 'zlineupId') or not self.zlineupId:
+                    if not self.zlineupId:
                         for cookie in self.session.cookies:
                             if cookie.name == "ServiceID":
                                 self.zlineupId = cookie.value
                                 self.pout(f"Discovered lineup ID: {self.zlineupId}\n")
                                 break
                     
-                    if not hasattr(self, 'zlineupId') or not self.zlineupId:
+                    if not self.zlineupId:
                         raise Exception("Could not determine lineup ID")
                     
-                    if not hasattr(self, 'allChan') or not self.allChan:
+                    if not self.allChan:
                         r = self.session.get(
                             f"{self.tvgurl}user/favorites/?provider={self.zlineupId}",
                             headers={'X-Requested-With': 'XMLHttpRequest'}
@@ -591,6 +875,7 @@ class Zap2XML:
         raise Exception(f"Failed to login within {self.retries} retries.")
 
     def login_zap(self):
+        import requests
         rc = 0
         while rc < self.retries:
             rc += 1
@@ -630,7 +915,7 @@ class Zap2XML:
                     self.lineupId = lineup[0]
                     self.device = '-'
                 
-                if not hasattr(self, 'allChan') or not self.allChan:
+                if not self.allChan:
                     r = self.session.post(
                         f"{self.urlRoot}api/user/favorites",
                         data={'token': self.zapToken},
@@ -658,6 +943,10 @@ class Zap2XML:
         return params
 
     def get_zap_params(self):
+        # Lineup parameters don't change after login; build them once
+        if self.zapParams is not None and self.zapParamsKey == (self.zlineupId, self.zipcode, self.zapToken):
+            return dict(self.zapParams)
+
         params = {}
         if self.zlineupId or self.zipcode:
             self.postalcode = self.zipcode
@@ -670,8 +959,6 @@ class Zap2XML:
             else:
                 self.lineupId = self.zlineupId
                 self.device = "-"
-                
-            params['postalCode'] = self.postalcode
         else:
             params['token'] = self.get_z_token()
             
@@ -681,7 +968,11 @@ class Zap2XML:
         params['headendId'] = self.lineupId
         params['device'] = self.device
         params['aid'] = 'orbebb'
-        return params
+
+        # get_z_token() may have logged in, so key on the state after building
+        self.zapParamsKey = (self.zlineupId, self.zipcode, self.zapToken)
+        self.zapParams = params
+        return dict(params)
 
     def get_z_token(self):
         if not self.zapToken:
@@ -690,43 +981,37 @@ class Zap2XML:
 
     def parse_tvg_favs(self, buffer):
         try:
-            t = json.loads(buffer)
+            t = json_loads(buffer)
             if 'message' in t:
-                for f in t['message']:
-                    source = f.get('source', '')
-                    channel = f.get('channel', '')
-                    self.tvgfavs[f"{channel}.{source}"] = 1
+                self.tvgfavs.update(f"{f.get('channel', '')}.{f.get('source', '')}" for f in t['message'])
                 self.pout(f"Lineup {self.zlineupId} favorites: {len(self.tvgfavs)}\n")
         except json.JSONDecodeError:
             pass
 
     def parse_z_favs(self, buffer):
         try:
-            t = json.loads(buffer)
+            t = json_loads(buffer)
             if 'channels' in t:
                 for f in t['channels']:
-                    if hasattr(self, 'R') and self.R:
+                    if self.R:
                         # Remove favorite
-                        data = urllib.parse.urlencode({
-                            'token': self.zapToken,
-                            'prgsvcid': f,
-                            'addToFav': 'false'
-                        }).encode('utf-8')
-                        
-                        req = urllib.request.Request(
+                        r = self.session.post(
                             f"{self.urlRoot}api/user/ChannelAddtofav",
-                            data=data,
+                            data={
+                                'token': self.zapToken,
+                                'prgsvcid': f,
+                                'addToFav': 'false'
+                            },
                             headers={'X-Requested-With': 'XMLHttpRequest'}
                         )
-                        r = self.ua.open(req)
-                        if r.getcode() == 200:
+                        if r.status_code == 200:
                             self.pout(f"Removed favorite {f}\n")
                         else:
-                            self.perr(f"RF{r.getcode()}: {r.read().decode('utf-8')}\n")
+                            self.perr(f"RF{r.status_code}: {r.text}\n")
                     else:
-                        self.zapFavorites[f] = 1
+                        self.zapFavorites.add(f)
                         
-                if hasattr(self, 'R') and self.R:
+                if self.R:
                     self.pout("Removed favorites, exiting\n")
                     sys.exit(0)
                     
@@ -736,19 +1021,21 @@ class Zap2XML:
 
     def parse_tvg_icons(self):
         try:
-            import requests
             from PIL import Image
         except ImportError:
-            self.perr("Required modules (requests, PIL) not found for icon parsing\n")
+            self.perr("Required module PIL not found for icon parsing\n")
             return
             
+        if self.session is None:
+            self.login()
+            
         css_url = f"{self.tvgspritesurl}{self.zlineupId}.css"
-        r = requests.get(css_url)
+        r = self.session.get(css_url)
         if r.status_code != 200:
             return
             
         css_content = r.text
-        match = re.search(r'background-image:.+?url\((.+?)\)', css_content)
+        match = self.reSpriteBG.search(css_content)
         if not match:
             return
             
@@ -761,7 +1048,7 @@ class Zap2XML:
         sprite_path = os.path.join(self.iconDir, f"sprites-{filename}")
         
         # Download sprite image
-        r = requests.get(sprite_url)
+        r = self.session.get(sprite_url)
         if r.status_code != 200:
             return
             
@@ -769,10 +1056,15 @@ class Zap2XML:
             f.write(r.content)
             
         try:
-            im = Image.open(sprite_path)
+            # Decode the sprite once from memory; every crop then shares the pixel data
+            im = Image.open(io.BytesIO(r.content))
+            im.load()
             iconw, iconh = 30, 20
+            ext = os.path.splitext(filename)[1]
+            # Tiles are tiny and rewritten every run; don't spend time squeezing them
+            save_opts = {'compress_level': 1} if ext.lower() == '.png' else {}
             
-            for match in re.finditer(r'listings-channel-icon-(.+?)\{.+?position:.*?-(\d+).+?(\d+).*?\}', css_content, re.I):
+            for match in self.reSpriteIcon.finditer(css_content):
                 cid = match.group(1)
                 iconx = int(match.group(2))
                 icony = int(match.group(3))
@@ -782,464 +1074,489 @@ class Zap2XML:
                 
                 self.logos[cid] = {
                     'logo': f"sprite-{cid}",
-                    'logoExt': os.path.splitext(filename)[1]
+                    'logoExt': ext
                 }
                 
-                icon_path = os.path.join(self.iconDir, f"{self.logos[cid]['logo']}{self.logos[cid]['logoExt']}")
-                icon.save(icon_path)
+                icon_path = os.path.join(self.iconDir, f"sprite-{cid}{ext}")
+                icon.save(icon_path, **save_opts)
         except Exception as e:
             self.perr(f"Error processing icons: {e}\n")
 
     def parse_tvg_grid(self, filename):
         try:
-            with gzip.open(filename, 'rb') as f:
-                content = f.read().decode('utf-8')
-                t = json.loads(content)
+            t = json_loads(self.read_gzip_file(filename))
+            programs, schedule, stations, details = self.programs, self.schedule, self.stations, self.details
+            tvgfavs = self.tvgfavs
+            is_tba = self.is_tba
+            
+            for e in t:
+                cjs = e.get('Channel', {})
+                src = cjs.get('SourceId', '')
+                num = cjs.get('Number', '')
+                cs = f"{num}.{src}"
                 
-                for e in t:
-                    cjs = e.get('Channel', {})
-                    src = cjs.get('SourceId', '')
-                    num = cjs.get('Number', '')
-                    cs = f"{num}.{src}"
+                # Skip if not in favorites
+                if tvgfavs and cs not in tvgfavs:
+                    continue
+                    
+                # Add station if not exists
+                if cs not in stations:
+                    stations[cs] = {
+                        'stnNum': src,
+                        'number': num,
+                        'name': cjs.get('Name', ''),
+                        'order': self.coNum if self.retainOrder else num
+                    }
+                    self.coNum += 1
                     
-                    # Skip if not in favorites
-                    if self.tvgfavs and cs not in self.tvgfavs:
+                    fullname = cjs.get('FullName', '')
+                    if fullname and fullname != cjs.get('Name', ''):
+                        stations[cs]['fullname'] = fullname
+                        
+                # Process program schedules
+                sched = schedule.get(cs)
+                for pe in e.get('ProgramSchedules', []):
+                    if not pe.get('ProgramId'):
                         continue
                         
-                    # Add station if not exists
-                    if cs not in self.stations:
-                        self.stations[cs] = {
-                            'stnNum': src,
-                            'number': num,
-                            'name': cjs.get('Name', ''),
-                            'order': self.coNum if hasattr(self, 'retainOrder') and self.retainOrder else num
-                        }
-                        self.coNum += 1
+                    cp = pe['ProgramId']
+                    catid = pe.get('CatId', 0)
+                    prog = programs.get(cp)
+                    if prog is None:
+                        prog = programs[cp] = {}
+                    
+                    # Set genre based on category, and series genre if needed
+                    genre = CATID_GENRES.get(catid)
+                    series = pe.get('ParentProgramId', 0) != 0 or (self.seriesCategory and catid != 1)
+                    if genre or series:
+                        genres = prog.get('genres')
+                        if genres is None:
+                            genres = prog['genres'] = {}
+                        if genre:
+                            genres[genre] = 1
+                        if series:
+                            genres['series'] = 99
                         
-                        fullname = cjs.get('FullName', '')
-                        if fullname and fullname != cjs.get('Name', ''):
-                            self.stations[cs]['fullname'] = fullname
-                            
-                    # Process program schedules
-                    for pe in e.get('ProgramSchedules', []):
-                        if not pe.get('ProgramId'):
-                            continue
-                            
-                        cp = pe['ProgramId']
-                        catid = pe.get('CatId', 0)
+                    # Basic program info
+                    prog['title'] = pe.get('Title', '')
+                    if is_tba(prog['title']):
+                        self.tba = 1
                         
-                        # Set genre based on category
-                        if catid == 1:
-                            self.programs.setdefault(cp, {}).setdefault('genres', {})['movie'] = 1
-                        elif catid == 2:
-                            self.programs.setdefault(cp, {}).setdefault('genres', {})['sports'] = 1
-                        elif catid == 3:
-                            self.programs.setdefault(cp, {}).setdefault('genres', {})['family'] = 1
-                        elif catid == 4:
-                            self.programs.setdefault(cp, {}).setdefault('genres', {})['news'] = 1
-                            
-                        # Set series genre if needed
-                        if pe.get('ParentProgramId', 0) != 0 or (hasattr(self, 'seriesCategory') and self.seriesCategory and catid != 1):
-                            self.programs.setdefault(cp, {}).setdefault('genres', {})['series'] = 99
-                            
-                        # Basic program info
-                        self.programs.setdefault(cp, {})['title'] = pe.get('Title', '')
-                        if re.search(self.sTBA, self.programs[cp]['title'], re.I):
+                    episode_title = pe.get('EpisodeTitle', '')
+                    if episode_title:
+                        prog['episode'] = episode_title
+                        if is_tba(episode_title):
                             self.tba = 1
                             
-                        episode_title = pe.get('EpisodeTitle', '')
-                        if episode_title:
-                            self.programs[cp]['episode'] = episode_title
-                            if re.search(self.sTBA, episode_title, re.I):
-                                self.tba = 1
-                                
-                        description = pe.get('CopyText', '')
-                        if description:
-                            self.programs[cp]['description'] = description
-                            
-                        rating = pe.get('Rating', '')
-                        if rating:
-                            self.programs[cp]['rating'] = rating
-                            
-                        # Schedule info
-                        sch = pe.get('StartTime', 0) * 1000
-                        self.schedule.setdefault(cs, {})[sch] = {
-                            'time': sch,
-                            'endtime': pe.get('EndTime', 0) * 1000,
-                            'program': cp,
-                            'station': cs
-                        }
+                    description = pe.get('CopyText', '')
+                    if description:
+                        prog['description'] = description
                         
-                        # Airing attributes
-                        airat = pe.get('AiringAttrib', 0)
-                        if airat & 1:
-                            self.schedule[cs][sch]['live'] = 1
-                        elif airat & 4:
-                            self.schedule[cs][sch]['new'] = 1
-                            
-                        # TV object info
-                        tvo = pe.get('TVObject', {})
-                        if tvo:
-                            season_num = tvo.get('SeasonNumber', 0)
-                            if season_num != 0:
-                                self.programs[cp]['seasonNum'] = season_num
-                                episode_num = tvo.get('EpisodeNumber', 0)
-                                if episode_num != 0:
-                                    self.programs[cp]['episodeNum'] = episode_num
-                                    
-                            ead = tvo.get('EpisodeAirDate', '')
+                    rating = pe.get('Rating', '')
+                    if rating:
+                        prog['rating'] = rating
+                        
+                    # Schedule info
+                    sch = pe.get('StartTime', 0) * 1000
+                    if sched is None:
+                        sched = schedule[cs] = {}
+                    entry = sched[sch] = {
+                        'time': sch,
+                        'endtime': pe.get('EndTime', 0) * 1000,
+                        'program': cp,
+                        'station': cs,
+                        'flags': 0
+                    }
+                    
+                    # Airing attributes
+                    airat = pe.get('AiringAttrib', 0)
+                    if airat & 1:
+                        entry['flags'] = SLOT_LIVE
+                    elif airat & 4:
+                        entry['flags'] = SLOT_NEW
+                        
+                    # TV object info
+                    tvo = pe.get('TVObject', {})
+                    if tvo:
+                        season_num = tvo.get('SeasonNumber', 0)
+                        if season_num != 0:
+                            prog['seasonNum'] = season_num
+                            episode_num = tvo.get('EpisodeNumber', 0)
+                            if episode_num != 0:
+                                prog['episodeNum'] = episode_num
+                                
+                        ead = tvo.get('EpisodeAirDate', '')
+                        if ead:
+                            ead = self.reEAD.sub('', ead)
                             if ead:
-                                ead = re.sub(r'[^0-9-]', '', ead)
-                                if ead:
-                                    self.programs[cp]['originalAirDate'] = ead
-                                    
-                            url = None
-                            if tvo.get('EpisodeSEOUrl', ''):
-                                url = tvo['EpisodeSEOUrl']
-                            elif tvo.get('SEOUrl', ''):
-                                url = tvo['SEOUrl']
-                                if catid == 1 and 'movies' not in url:
-                                    url = f"/movies{url}"
-                                    
-                            if url:
-                                self.programs[cp]['url'] = f"{self.tvgurl[:-1]}{url}"
+                                prog['originalAirDate'] = ead
                                 
-                        # Get details if needed
-                        if (hasattr(self, 'includeIcons') and self.includeIcons) or \
-                           (hasattr(self, 'includeDetails') and self.includeDetails and self.programs[cp].get('genres', {}).get('movie')) or \
-                           (hasattr(self, 'W') and self.W and self.programs[cp].get('genres', {}).get('movie')):
-                            self.get_details(self.parse_tvg_details, cp, f"{self.tvgMapiRoot}listings/details?program={cp}", "")
+                        url = None
+                        if tvo.get('EpisodeSEOUrl', ''):
+                            url = tvo['EpisodeSEOUrl']
+                        elif tvo.get('SEOUrl', ''):
+                            url = tvo['SEOUrl']
+                            if catid == 1 and 'movies' not in url:
+                                url = f"/movies{url}"
+                                
+                        if url:
+                            prog['url'] = f"{self.tvgurl[:-1]}{url}"
+                            
+                    # Get details if needed
+                    if (self.includeIcons) or \
+                       (self.includeDetails and prog.get('genres', {}).get('movie')) or \
+                       (self.W and prog.get('genres', {}).get('movie')):
+                        details.setdefault(cp, f"{self.tvgMapiRoot}listings/details?program={cp}")
+            return True
         except Exception as e:
             self.perr(f"Error parsing TVG grid: {e}\n")
 
     def parse_tvg_details(self, filename):
         try:
-            with gzip.open(filename, 'rb') as f:
-                content = f.read().decode('utf-8')
-                t = json.loads(content)
+            t = json_loads(self.read_gzip_file(filename))
+            
+            cur = self.programs[self.cp]
+            prog = t.get('program', {})
+            if 'release_year' in prog:
+                cur['movie_year'] = prog['release_year']
                 
-                prog = t.get('program', {})
-                if 'release_year' in prog:
-                    self.programs[self.cp]['movie_year'] = prog['release_year']
+            if 'rating' in prog and 'rating' not in cur:
+                if prog['rating'] != 'NR':
+                    cur['rating'] = prog['rating']
                     
-                if 'rating' in prog and 'rating' not in self.programs[self.cp]:
-                    if prog['rating'] != 'NR':
-                        self.programs[self.cp]['rating'] = prog['rating']
-                        
-                tvo = t.get('tvobject', {})
-                if 'photos' in tvo:
-                    phash = {}
-                    for ph in tvo['photos']:
-                        w = ph.get('width', 0) * ph.get('height', 0)
-                        u = ph.get('url', '')
-                        if w and u:
-                            phash[w] = u
-                            
-                    if phash:
-                        biggest = max(phash.keys())
-                        self.programs[self.cp]['imageUrl'] = phash[biggest]
+            tvo = t.get('tvobject', {})
+            if 'photos' in tvo:
+                # Biggest photo with a URL; on a tie the later one wins
+                best = max(reversed(tvo['photos']), default=None,
+                           key=lambda ph: ph.get('width', 0) * ph.get('height', 0) if ph.get('url', '') else 0)
+                if best and best.get('url', '') and best.get('width', 0) * best.get('height', 0):
+                    cur['imageUrl'] = best['url']
         except Exception as e:
             self.perr(f"Error parsing TVG details: {e}\n")
 
     def parse_json(self, filename):
         try:
-            with gzip.open(filename, 'rb') as f:
-                content = f.read().decode('utf-8')
-                t = json.loads(content)
-                
-                zapStarred = {}
-                for s in t.get('channels', []):
-                    channelId = s.get('channelId')
-                    if not channelId:
+            t = json_loads(self.read_gzip_file(filename))
+            
+            programs, schedule, stations, details = self.programs, self.schedule, self.stations, self.details
+            zapFavorites = self.zapFavorites
+            is_tba = self.is_tba
+            
+            zapStarred = set()
+            for s in t.get('channels', []):
+                channelId = s.get('channelId')
+                if not channelId:
+                    continue
+                    
+                # Skip if not in favorites
+                if not self.allChan and zapFavorites:
+                    if channelId in zapFavorites:
+                        if self.opt8:
+                            if channelId in zapStarred:
+                                continue
+                            zapStarred.add(channelId)
+                    else:
                         continue
                         
-                    # Skip if not in favorites
-                    if not self.allChan and self.zapFavorites:
-                        if channelId in self.zapFavorites:
-                            if hasattr(self, 'opt8') and self.opt8:
-                                if channelId in zapStarred:
-                                    continue
-                                zapStarred[channelId] = 1
-                        else:
-                            continue
+                # Add station info
+                cs = f"{s.get('channelNo', '')}.{channelId}"
+                if cs not in stations:
+                    stations[cs] = {
+                        'stnNum': channelId,
+                        'name': s.get('callSign', ''),
+                        'number': s.get('channelNo', '').lstrip('0'),
+                        'order': self.coNum if self.retainOrder else s.get('channelNo', '').lstrip('0')
+                    }
+                    self.coNum += 1
+                    
+                    # Handle station logo
+                    thumbnail = s.get('thumbnail', '')
+                    if thumbnail:
+                        thumbnail = self.reThumbQuery.sub('', thumbnail)
+                        if not thumbnail.startswith('http'):
+                            thumbnail = f"https:{thumbnail}"
+                        stations[cs]['logoURL'] = thumbnail
+                        if self.iconDir:
+                            self.handle_logo(thumbnail)
                             
-                    # Add station info
-                    cs = f"{s.get('channelNo', '')}.{channelId}"
-                    if cs not in self.stations:
-                        self.stations[cs] = {
-                            'stnNum': channelId,
-                            'name': s.get('callSign', ''),
-                            'number': s.get('channelNo', '').lstrip('0'),
-                            'order': self.coNum if hasattr(self, 'retainOrder') and self.retainOrder else s.get('channelNo', '').lstrip('0')
-                        }
-                        self.coNum += 1
+                # Process events
+                sched = schedule.get(cs)
+                for e in s.get('events', []):
+                    program = e.get('program', {})
+                    cp = program.get('id')
+                    if not cp:
+                        continue
                         
-                        # Handle station logo
-                        thumbnail = s.get('thumbnail', '')
-                        if thumbnail:
-                            thumbnail = re.sub(r'\?.*', '', thumbnail)
-                            if not thumbnail.startswith('http'):
-                                thumbnail = f"https:{thumbnail}"
-                            self.stations[cs]['logoURL'] = thumbnail
-                            if hasattr(self, 'iconDir') and self.iconDir:
-                                self.handle_logo(thumbnail)
-                                
-                    # Process events
-                    for e in s.get('events', []):
-                        program = e.get('program', {})
-                        cp = program.get('id')
-                        if not cp:
-                            continue
-                            
-                        # Basic program info
-                        self.programs.setdefault(cp, {})['title'] = program.get('title', '')
-                        if re.search(self.sTBA, self.programs[cp]['title'], re.I):
-                            self.tba = 1
-                            
-                        episode_title = program.get('episodeTitle', '')
-                        if episode_title:
-                            self.programs[cp]['episode'] = episode_title
-                            
-                        description = program.get('shortDesc', '')
-                        if description:
-                            self.programs[cp]['description'] = description
-                            
-                        duration = int(e.get('duration', 0))
-                        if duration > 0:
-                            self.programs[cp]['duration'] = duration
-                            
-                        release_year = program.get('releaseYear', '')
-                        if release_year:
-                            self.programs[cp]['movie_year'] = release_year
-                            
-                        season = program.get('season', '')
-                        if season:
-                            self.programs[cp]['seasonNum'] = season
-                            
-                        episode = program.get('episode', '')
-                        if episode:
-                            self.programs[cp]['episodeNum'] = episode
-                            
-                        # Program image
-                        thumbnail = e.get('thumbnail', '')
-                        if thumbnail:
-                            self.programs[cp]['imageUrl'] = f"{self.urlAssets}{thumbnail}.jpg"
-                            
-                        # Program URL
-                        series_id = program.get('seriesId', '')
-                        tms_id = program.get('tmsId', '')
-                        if series_id and tms_id:
-                            self.programs[cp]['url'] = f"{self.urlRoot}overview-affiliates.html?programSeriesId={series_id}&tmsId={tms_id}"
-                            
-                        # Schedule info
-                        start_time = self.str2time1(e.get('startTime', '')) * 1000
-                        self.schedule.setdefault(cs, {})[start_time] = {
-                            'time': start_time,
-                            'endTime': self.str2time1(e.get('endTime', '')) * 1000,
-                            'program': cp,
-                            'station': cs
-                        }
+                    prog = programs.get(cp)
+                    if prog is None:
+                        prog = programs[cp] = {}
                         
-                        # Genres
-                        genres = e.get('filter', [])
-                        if genres:
-                            for i, g in enumerate(genres, 1):
-                                g = re.sub(r'filter-', '', g, flags=re.I)
-                                self.programs.setdefault(cp, {}).setdefault('genres', {})[g.lower()] = i
-                                
-                        # Rating
-                        rating = e.get('rating', '')
-                        if rating:
-                            self.programs[cp]['rating'] = rating
-                            
-                        # Tags (like CC)
-                        tags = e.get('tags', [])
-                        if 'CC' in tags:
-                            self.schedule[cs][start_time]['cc'] = 1
-                            
-                        # Flags (like New, Live)
-                        flags = e.get('flag', [])
-                        if 'New' in flags:
-                            self.schedule[cs][start_time]['new'] = 'New'
-                            self.set_original_air_date(cp, cs, start_time)
-                        if 'Live' in flags:
-                            self.schedule[cs][start_time]['live'] = 'Live'
-                            self.set_original_air_date(cp, cs, start_time)
-                        if 'Premiere' in flags:
-                            self.schedule[cs][start_time]['premiere'] = 'Premiere'
-                        if 'Finale' in flags:
-                            self.schedule[cs][start_time]['finale'] = 'Finale'
-                            
-                        # Series category if needed
-                        if hasattr(self, 'seriesCategory') and self.seriesCategory and not cp.startswith('MV'):
-                            self.programs.setdefault(cp, {}).setdefault('genres', {})['series'] = 99
+                    # Basic program info
+                    prog['title'] = program.get('title', '')
+                    if is_tba(prog['title']):
+                        self.tba = 1
+                        
+                    episode_title = program.get('episodeTitle', '')
+                    if episode_title:
+                        prog['episode'] = episode_title
+                        
+                    description = program.get('shortDesc', '')
+                    if description:
+                        prog['description'] = description
+                        
+                    duration = int(e.get('duration', 0))
+                    if duration > 0:
+                        prog['duration'] = duration
+                        
+                    release_year = program.get('releaseYear', '')
+                    if release_year:
+                        prog['movie_year'] = release_year
+                        
+                    season = program.get('season', '')
+                    if season:
+                        prog['seasonNum'] = season
+                        
+                    episode = program.get('episode', '')
+                    if episode:
+                        prog['episodeNum'] = episode
+                        
+                    # Program image
+                    thumbnail = e.get('thumbnail', '')
+                    if thumbnail:
+                        prog['imageUrl'] = f"{self.urlAssets}{thumbnail}.jpg"
+                        
+                    # Program URL
+                    series_id = program.get('seriesId', '')
+                    tms_id = program.get('tmsId', '')
+                    if series_id and tms_id:
+                        prog['url'] = f"{self.urlRoot}overview-affiliates.html?programSeriesId={series_id}&tmsId={tms_id}"
+                        
+                    # Schedule info
+                    start_time = self.str2time1(e.get('startTime', '')) * 1000
+                    if sched is None:
+                        sched = schedule[cs] = {}
+                    entry = sched[start_time] = {
+                        'time': start_time,
+                        'endTime': self.str2time1(e.get('endTime', '')) * 1000,
+                        'program': cp,
+                        'station': cs,
+                        'flags': 0
+                    }
+                    
+                    # Genres
+                    genres = e.get('filter', [])
+                    if genres:
+                        pgenres = prog.get('genres')
+                        if pgenres is None:
+                            pgenres = prog['genres'] = {}
+                        # Lowercase first so a plain replace strips 'filter-' in any case
+                        pgenres.update((g.lower().replace('filter-', ''), i) for i, g in enumerate(genres, 1))
                             
-                        # Get details if needed
-                        if hasattr(self, 'includeDetails') and self.includeDetails and not program.get('isGeneric', True):
-                            self.post_json_overview(cp, program.get('seriesId', ''))
+                    # Rating
+                    rating = e.get('rating', '')
+                    if rating:
+                        prog['rating'] = rating
+                        
+                    # Tags (like CC)
+                    tags = e.get('tags', [])
+                    if 'CC' in tags:
+                        entry['flags'] |= SLOT_CC
+                        
+                    # Flags (like New, Live)
+                    flags = e.get('flag', [])
+                    if 'New' in flags:
+                        entry['flags'] |= SLOT_NEW
+                        self.set_original_air_date(cp, cs, start_time)
+                    if 'Live' in flags:
+                        entry['flags'] |= SLOT_LIVE
+                        self.set_original_air_date(cp, cs, start_time)
+                    if 'Premiere' in flags:
+                        entry['premiere'] = 'Premiere'
+                    if 'Finale' in flags:
+                        entry['finale'] = 'Finale'
+                        
+                    # Series category if needed
+                    if self.seriesCategory and not cp.startswith('MV'):
+                        pgenres = prog.get('genres')
+                        if pgenres is None:
+                            pgenres = prog['genres'] = {}
+                        pgenres['series'] = 99
+                        
+                    # Get details if needed
+                    if self.includeDetails and not program.get('isGeneric', True):
+                        details.setdefault(cp, program.get('seriesId', ''))
+            return True
         except Exception as e:
             self.perr(f"Error parsing JSON: {e}\n")
 
-    def post_json_overview(self, cp, sid):
-        fn = os.path.join(self.cacheDir, f"O{cp}.js.gz")
+    def post_json_overview(self, job):
+        cp, fn, sid = job
+        url = f"{self.urlRoot}api/program/overviewDetails"
+        self.pout(f"[{self.treq}] Post {sid}: {url}\n")
+        time.sleep(self.sleeptime)
         
-        # Try to use cached version if available
-        if not os.path.exists(fn) and sid in self.sidCache and os.path.exists(self.sidCache[sid]):
-            shutil.copyfile(self.sidCache[sid], fn)
-            
-        if not os.path.exists(fn):
-            url = f"{self.urlRoot}api/program/overviewDetails"
-            self.pout(f"[{self.treq}] Post {sid}: {url}\n")
-            time.sleep(self.sleeptime)
+        params = self.get_zap_p_params()
+        params['programSeriesID'] = sid
+        params['clickstream[FromPage]'] = 'TV%20Grid'
+        
+        try:
+            r = self.session.post(url, data=params, headers={'X-Requested-With': 'XMLHttpRequest'})
+            content = r.content
+            with self.statsLock:
+                self.treq += 1
+                self.tb += len(content)
+            if r.status_code == 200:
+                self.write_gzip_file(fn, content)
+                return True
+            self.perr(f"{cp} : {r.status_code}\n")
+        except Exception as e:
+            self.perr(f"Error posting JSON overview: {e}\n")
+        return False
+
+    def parse_json_overview(self, filename):
+        cp = self.cp
+        try:
+            t = json_loads(self.read_gzip_file(filename))
             
-            params = self.get_zap_p_params()
-            params['programSeriesID'] = sid
-            params['clickstream[FromPage]'] = 'TV%20Grid'
+            prog = self.programs.setdefault(cp, {})
             
-            data = urllib.parse.urlencode(params).encode('utf-8')
-            req = urllib.request.Request(
-                url,
-                data=data,
-                headers={'X-Requested-With': 'XMLHttpRequest'}
-            )
-            
-            try:
-                r = self.ua.open(req)
-                if r.getcode() == 200:
-                    content = r.read().decode('utf-8')
-                    self.write_binary_file(fn, gzip.compress(content.encode('utf-8')))
-                    self.sidCache[sid] = fn
-                else:
-                    self.perr(f"{cp} : {r.getcode()}\n")
-            except Exception as e:
-                self.perr(f"Error posting JSON overview: {e}\n")
+            # Process series genres
+            series_genres = t.get('seriesGenres', '')
+            if series_genres:
+                gh = prog.get('genres', {})
+                max_val = max(gh.values()) if gh else 0
+                i = max_val + 1 if max_val else 2
                 
-        if os.path.exists(fn):
-            self.pout(f"[D] Parsing: {cp}\n")
-            try:
-                with gzip.open(fn, 'rb') as f:
-                    content = f.read().decode('utf-8')
-                    t = json.loads(content)
-                    
-                    # Process series genres
-                    series_genres = t.get('seriesGenres', '')
-                    if series_genres:
-                        gh = self.programs.get(cp, {}).get('genres', {})
-                        max_val = max(gh.values()) if gh else 0
-                        i = max_val + 1 if max_val else 2
-                        
-                        for sg in series_genres.split('|'):
-                            sg = sg.lower()
-                            if sg not in gh:
-                                gh[sg] = i
-                                i += 1
-                                
-                    # Process cast
-                    i = 1
-                    for c in t.get('overviewTab', {}).get('cast', []):
-                        name = c.get('name', '')
-                        if not name:
-                            continue
-                            
-                        character = c.get('characterName', '')
-                        role = c.get('role', '').lower()
-                        
-                        if role == 'host':
-                            self.programs.setdefault(cp, {}).setdefault('presenter', {})[name] = i
-                        else:
-                            self.programs.setdefault(cp, {}).setdefault('actor', {})[name] = i
-                            if character:
-                                self.programs.setdefault(cp, {}).setdefault('role', {})[name] = character
+                for sg in series_genres.split('|'):
+                    sg = sg.lower()
+                    if sg not in gh:
+                        gh[sg] = i
                         i += 1
                         
-                    # Process crew
-                    i = 1
-                    for c in t.get('overviewTab', {}).get('crew', []):
-                        name = c.get('name', '')
-                        if not name:
-                            continue
-                            
-                        role = c.get('role', '').lower()
-                        if 'producer' in role:
-                            self.programs.setdefault(cp, {}).setdefault('producer', {})[name] = i
-                        elif 'director' in role:
-                            self.programs.setdefault(cp, {}).setdefault('director', {})[name] = i
-                        elif 'writer' in role:
-                            self.programs.setdefault(cp, {}).setdefault('writer', {})[name] = i
-                        i += 1
-                        
-                    # Update image if not set
-                    if 'imageUrl' not in self.programs.get(cp, {}) and t.get('seriesImage', ''):
-                        self.programs[cp]['imageUrl'] = f"{self.urlAssets}{t['seriesImage']}.jpg"
-                        
-                    # Update description for movies and shows
-                    if cp.startswith(('MV', 'SH')):
-                        series_desc = t.get('seriesDescription', '')
-                        if series_desc and len(series_desc) > len(self.programs.get(cp, {}).get('description', '')):
-                            self.programs[cp]['description'] = series_desc
-                            
-                    # Original air date for episodes
-                    if cp.startswith('EP'):
-                        ue = t.get('overviewTab', {}).get('upcomingEpisode', {})
+            # Process cast
+            i = 1
+            for c in t.get('overviewTab', {}).get('cast', []):
+                name = c.get('name', '')
+                if not name:
+                    continue
+                    
+                character = c.get('characterName', '')
+                role = c.get('role', '').lower()
+                
+                if role == 'host':
+                    prog.setdefault('presenter', {})[name] = i
+                else:
+                    prog.setdefault('actor', {})[name] = i
+                    if character:
+                        prog.setdefault('role', {})[name] = character
+                i += 1
+                
+            # Process crew
+            i = 1
+            for c in t.get('overviewTab', {}).get('crew', []):
+                name = c.get('name', '')
+                if not name:
+                    continue
+                    
+                role = c.get('role', '').lower()
+                if 'producer' in role:
+                    prog.setdefault('producer', {})[name] = i
+                elif 'director' in role:
+                    prog.setdefault('director', {})[name] = i
+                elif 'writer' in role:
+                    prog.setdefault('writer', {})[name] = i
+                i += 1
+                
+            # Update image if not set
+            if 'imageUrl' not in prog and t.get('seriesImage', ''):
+                prog['imageUrl'] = f"{self.urlAssets}{t['seriesImage']}.jpg"
+                
+            # Update description for movies and shows
+            if cp.startswith(('MV', 'SH')):
+                series_desc = t.get('seriesDescription', '')
+                if series_desc and len(series_desc) > len(prog.get('description', '')):
+                    prog['description'] = series_desc
+                    
+            # Original air date for episodes
+            if cp.startswith('EP'):
+                ue = t.get('overviewTab', {}).get('upcomingEpisode', {})
+                if (ue.get('tmsID', '').lower() == cp.lower() and 
+                    ue.get('originalAirDate', '') not in ('', '1000-01-01T00:00Z')):
+                    oad = self.str2time2(ue['originalAirDate']) * 1000
+                    prog['originalAirDate'] = oad
+                else:
+                    for ue in t.get('upcomingEpisodeTab', []):
                         if (ue.get('tmsID', '').lower() == cp.lower() and 
                             ue.get('originalAirDate', '') not in ('', '1000-01-01T00:00Z')):
                             oad = self.str2time2(ue['originalAirDate']) * 1000
-                            self.programs[cp]['originalAirDate'] = oad
-                        else:
-                            for ue in t.get('upcomingEpisodeTab', []):
-                                if (ue.get('tmsID', '').lower() == cp.lower() and 
-                                    ue.get('originalAirDate', '') not in ('', '1000-01-01T00:00Z')):
-                                    oad = self.str2time2(ue['originalAirDate']) * 1000
-                                    self.programs[cp]['originalAirDate'] = oad
-                                    break
-            except Exception as e:
-                self.perr(f"Error parsing overview JSON: {e}\n")
-        else:
-            self.pout(f"Skipping: {sid}\n")
+                            prog['originalAirDate'] = oad
+                            break
+        except Exception as e:
+            self.perr(f"Error parsing overview JSON: {e}\n")
+
+    def is_tba(self, text):
+        if self.tbaWords is not None:
+            folded = text.casefold()
+            if not any(w in folded for w in self.tbaWords):
+                return False
+        return self.reTBA.search(text) is not None
 
     def set_original_air_date(self, cp, cs, sch):
-        if not cp.startswith(('EP', 'SH', 'MV')) or len(cp) < 10 or cp[10:14] == '0000':
+        if cp[:2] not in OAD_PREFIXES or len(cp) < 10 or cp[10:14] == '0000':
             return
             
-        if ('originalAirDate' not in self.programs.get(cp, {}) or 
-            sch < self.programs[cp].get('originalAirDate', float('inf'))):
-            self.programs.setdefault(cp, {})['originalAirDate'] = sch
-
-    def str2time1(self, s):
+        prog = self.programs.get(cp)
+        if prog is None:
+            prog = self.programs[cp] = {}
+        oad = prog.get('originalAirDate')
+        if oad is None or sch < oad:
+            prog['originalAirDate'] = sch
+
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def str2time1(s):
+        # 'YYYY-MM-DDTHH:MM:SSZ' (UTC); sliced by hand since strptime is slow
         try:
-            dt = datetime.strptime(s, '%Y-%m-%dT%H:%M:%SZ')
-            dt = dt.replace(tzinfo=timezone.utc)
-            return int(dt.timestamp())
-        except:
+            if len(s) != 20 or s[4] + s[7] + s[10] + s[13] + s[16] + s[19] != '--T::Z':
+                return 0
+            return Zap2XML.utc_time(int(s[0:4]), int(s[5:7]), int(s[8:10]),
+                                    int(s[11:13]), int(s[14:16]), int(s[17:19]))
+        except (TypeError, ValueError):
             return 0
 
-    def str2time2(self, s):
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def str2time2(s):
+        # 'YYYY-MM-DDTHH:MMZ' (UTC)
         try:
-            dt = datetime.strptime(s, '%Y-%m-%dT%H:%MZ')
-            dt = dt.replace(tzinfo=timezone.utc)
-            return int(dt.timestamp())
-        except:
+            if len(s) != 17 or s[4] + s[7] + s[10] + s[13] + s[16] != '--T:Z':
+                return 0
+            return Zap2XML.utc_time(int(s[0:4]), int(s[5:7]), int(s[8:10]),
+                                    int(s[11:13]), int(s[14:16]), 0)
+        except (TypeError, ValueError):
             return 0
 
-    def get_details(self, func, cp, url, prefix):
-        fn = os.path.join(self.cacheDir, f"{prefix}{cp}.js.gz")
-        if not os.path.exists(fn):
-            rs = self.get_url(url, True)
-            if rs:
-                self.write_binary_file(fn, gzip.compress(rs.encode('utf-8')))
-                
-        if os.path.exists(fn):
-            l = prefix if prefix else "D"
-            self.pout(f"[{l}] Parsing: {cp}\n")
-            self.cp = cp
-            func(fn)
-        else:
-            self.pout(f"Skipping: {cp}\n")
+    @staticmethod
+    def utc_time(year, month, day, hour, minute, second):
+        # Reject what strptime would have rejected; timegm would silently normalise it
+        if not (1 <= month <= 12 and 0 <= hour < 24 and 0 <= minute < 60 and 0 <= second < 62) or \
+                not 1 <= day <= calendar.monthrange(year, month)[1]:
+            return 0
+        return calendar.timegm((year, month, day, hour, minute, second, 0, 0, 0))
 
-    def get_url(self, url, er):
-        if not hasattr(self, 'session') or self.session is None:
+    def get_url(self, url, er, validators=None):
+        """
+        Fetches url, retrying on errors. If a validators dict is given, its 'etag'
+        is sent as If-None-Match and replaced with the response's ETag; a 304
+        reply returns None.
+        """
+        if self.session is None:
             self.login()  # Ensure session exists
             
+        headers = None
+        if validators and validators.get('etag'):
+            headers = {'If-None-Match': validators['etag']}
+            
         rc = 0
         while rc < self.retries:
             rc += 1
@@ -1247,19 +1564,24 @@ class Zap2XML:
             time.sleep(self.sleeptime)
             
             try:
-                r = self.session.get(url)
-                self.treq += 1
-                content = r.text
-                self.tb += len(content)
+                r = self.session.get(url, headers=headers)
+                content = r.content
+                with self.statsLock:
+                    self.treq += 1
+                    self.tb += len(content)
                 
-                if r.status_code == 200 and content:
+                if r.status_code == 304 and headers:
+                    return None
+                elif r.status_code == 200 and content:
+                    if validators is not None:
+                        validators['etag'] = r.headers.get('ETag')
                     return content
-                elif r.status_code == 500 and "Could not load details" in content:
-                    self.pout(f"{content}\n")
-                    return ""
+                elif r.status_code == 500 and b"Could not load details" in content:
+                    self.pout(f"{r.text}\n")
+                    return b""
                 else:
                     self.perr(f"[Attempt {rc}] {len(content)}:{r.status_code}\n")
-                    self.perr(f"{content}\n")
+                    self.perr(f"{r.text}\n")
                     time.sleep(self.sleeptime + 2)
             except Exception as e:
                 self.perr(f"[Attempt {rc}] Error: {str(e)}\n")
@@ -1268,26 +1590,32 @@ class Zap2XML:
         self.perr(f"Failed to download within {self.retries} retries.\n")
         if er:
             self.perr("Server out of data? Temporary server error? Normal exit anyway.\n")
-            return ""
+            return b""
         raise Exception("Failed to download URL")
 
-    def ua_open(self, url, data=None, headers=None):
-        req = urllib.request.Request(url, data=data)
-        if headers:
-            for k, v in headers.items():
-                req.add_header(k, v)
-        return self.ua.open(req)
-
-    def ua_get(self, url, headers=None):
-        return self.ua_open(url, headers=headers)
+    def read_gzip_file(self, filename):
+        # Decompressing in one call is much faster than reading through gzip.open;
+        # only very large files are streamed
+        if os.path.getsize(filename) < 64 << 20:
+            return gzip.decompress(Path(filename).read_bytes())
+        with open(filename, 'rb', buffering=GZIP_BUFFER_SIZE) as raw, gzip.GzipFile(fileobj=raw, mode='rb') as f:
+            return f.read()
 
-    def write_binary_file(self, filename, data):
+    def write_gzip_file(self, filename, data):
         try:
-            with open(filename, 'wb') as f:
+            with open(filename, 'wb', buffering=GZIP_BUFFER_SIZE) as raw, \
+                 gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=GZIP_LEVEL) as f:
                 f.write(data)
         except IOError as e:
             raise Exception(f"Failed to write '{filename}': {e}")
 
+    def unlink_grid_file(self, fn):
+        # A grid file goes together with its parsed .pkl and its .etag
+        self.unlink_file(fn)
+        for sidecar in (fn + '.pkl', fn + '.etag'):
+            if os.path.exists(sidecar):
+                self.unlink_file(sidecar)
+
     def unlink_file(self, filename):
         try:
             os.unlink(filename)
@@ -1295,7 +1623,7 @@ class Zap2XML:
             self.perr(f"Failed to delete '{filename}': {e}\n")
 
     def handle_logo(self, url):
-        if not hasattr(self, 'iconDir') or not self.iconDir:
+        if not self.iconDir:
             return
             
         if not os.path.exists(self.iconDir):
@@ -1309,11 +1637,14 @@ class Zap2XML:
         }
         
         filepath = os.path.join(self.iconDir, filename)
-        if not os.path.exists(filepath):
+        if not self.file_size(filepath):
             try:
-                r = self.ua_open(url)
+                if self.session is None:
+                    self.login()
+                r = self.session.get(url)
+                r.raise_for_status()
                 with open(filepath, 'wb') as f:
-                    f.write(r.read())
+                    f.write(r.content)
             except Exception as e:
                 self.perr(f"Failed to download logo: {e}\n")
 
@@ -1322,7 +1653,7 @@ class Zap2XML:
         if cid not in self.logos:
             cid = key.split('.')[-1]
             
-        if hasattr(self, 'iconDir') and cid in self.logos:
+        if self.iconDir and cid in self.logos:
             num = self.stations[key]['number']
             src = os.path.join(self.iconDir, f"{self.logos[cid]['logo']}{self.logos[cid]['logoExt']}")
             dest1 = os.path.join(self.iconDir, f"{num}{self.logos[cid]['logoExt']}")
@@ -1331,36 +1662,54 @@ class Zap2XML:
             
             try:
                 shutil.copyfile(src, dest1)
-                shutil.copyfile(src, dest2)
-                shutil.copyfile(src, dest3)
+                self.link_file(dest1, dest2)
+                self.link_file(dest1, dest3)
             except IOError as e:
                 self.perr(f"Failed to copy logo: {e}\n")
 
-    def sort_chan(self, a, b):
-        a_order = self.stations[a].get('order')
-        b_order = self.stations[b].get('order')
-        
-        if a_order is not None and b_order is not None:
-            cmp = (a_order > b_order) - (a_order < b_order)
-            if cmp == 0:
-                a_num = self.stations[a].get('stnNum', '')
-                b_num = self.stations[b].get('stnNum', '')
-                return (a_num > b_num) - (a_num < b_num)
-            return cmp
-        else:
-            a_name = self.stations[a].get('name', '')
-            b_name = self.stations[b].get('name', '')
-            return (a_name > b_name) - (a_name < b_name)
+    def link_file(self, src, dest):
+        # Hardlink where the filesystem allows it, otherwise copy
+        try:
+            if os.path.samefile(src, dest):
+                return
+            os.unlink(dest)
+        except FileNotFoundError:
+            pass
+        try:
+            os.link(src, dest)
+        except OSError:
+            shutil.copyfile(src, dest)
+
+    def chan_key(self, key):
+        # Channel order, then station number; stations without an order sort by name
+        station = self.stations[key]
+        order = station.get('order')
+        if order is not None:
+            return (0, order, station.get('stnNum', ''))
+        return (1, station.get('name', ''))
+
+    def sorted_stations(self):
+        # Every writer walks the stations in channel order; sort them once per run
+        if self.stationOrder is None:
+            self.stationOrder = sorted(self.stations.keys(), key=self.chan_key)
+        return self.stationOrder
 
     def station_to_channel(self, s):
-        if hasattr(self, 'useTVGuide') and self.useTVGuide:
-            return f"I{self.stations[s]['number']}.{self.stations[s]['stnNum']}.tvguide.com"
-        elif hasattr(self, 'oldStyleIds') and self.oldStyleIds:
-            return f"C{self.stations[s]['number']}{self.stations[s]['name'].lower()}.gracenote.com"
-        elif hasattr(self, 'opt9') and self.opt9:
-            return f"I{self.stations[s]['stnNum']}.labs.gracenote.com"
+        station = self.stations[s]
+        if self.useTVGuide:
+            return f"I{station['number']}.{station['stnNum']}.tvguide.com"
+        elif self.oldStyleIds:
+            return f"C{station['number']}{station['name'].lower()}.gracenote.com"
+        elif self.opt9:
+            return f"I{station['stnNum']}.labs.gracenote.com"
         else:
-            return f"I{self.stations[s]['number']}.{self.stations[s]['stnNum']}.gracenote.com"
+            return f"I{station['number']}.{station['stnNum']}.gracenote.com"
+
+    def channel_ids(self):
+        # Channel ids for every station, worked out once per run rather than per programme
+        if self.chanIds is None:
+            self.chanIds = {key: self.station_to_channel(key) for key in self.stations}
+        return self.chanIds
 
     def enc(self, t):
         if t is None:
@@ -1369,40 +1718,25 @@ class Zap2XML:
             t = str(t)
         t = t.strip()
             
-        if not hasattr(self, 'utf8') or not self.utf8:
+        if self.encLatin1:
             try:
                 t = t.encode('utf-8').decode('latin-1')
             except:
                 pass
                 
-        if not hasattr(self, 'encodeSelective') or self.encodeSelective is None or 'amp' in self.encodeSelective:
-            t = t.replace('&', '&amp;')
-        if not hasattr(self, 'encodeSelective') or self.encodeSelective is None or 'quot' in self.encodeSelective:
-            t = t.replace('"', '&quot;')
-        if not hasattr(self, 'encodeSelective') or self.encodeSelective is None or 'apos' in self.encodeSelective:
-            t = t.replace("'", '&apos;')
-        if not hasattr(self, 'encodeSelective') or self.encodeSelective is None or 'lt' in self.encodeSelective:
-            t = t.replace('<', '&lt;')
-        if not hasattr(self, 'encodeSelective') or self.encodeSelective is None or 'gt' in self.encodeSelective:
-            t = t.replace('>', '&gt;')
+        for c, e in self.encXml:
+            t = t.replace(c, e)
             
-        if hasattr(self, 'encodeEntities') and self.encodeEntities:
-            t = ''.join([f'&#{ord(c)};' if ord(c) > 127 else c for c in t])
+        if self.encEntities and not t.isascii():
+            t = t.translate(ENTITY_TABLE)
             
         return t
 
-    def append_asterisk(self, title, station, s):
-        if hasattr(self, 'appendAsterisk') and self.appendAsterisk:
-            if ('new' in self.appendAsterisk and 'new' in self.schedule[station][s]) or \
-               ('live' in self.appendAsterisk and 'live' in self.schedule[station][s]):
-                title += " *"
-        return title
-
     def print_header(self, fh, enc):
         fh.write('<?xml version="1.0" encoding="{}"?>\n'.format(enc))
         fh.write('<!DOCTYPE tv SYSTEM "xmltv.dtd">\n\n')
         
-        if hasattr(self, 'useTVGuide') and self.useTVGuide:
+        if self.useTVGuide:
             fh.write('<tv source-info-url="http://tvguide.com/" source-info-name="tvguide.com"')
         else:
             fh.write('<tv source-info-url="http://tvlistings.gracenote.com/" source-info-name="gracenote.com"')
@@ -1413,204 +1747,239 @@ class Zap2XML:
         fh.write('</tv>\n')
 
     def print_channels(self, fh):
-        for key in sorted(self.stations.keys(), key=cmp_to_key(self.sort_chan)):
-            sname = self.enc(self.stations[key].get('name'))
-            fname = self.enc(self.stations[key].get('fullname'))
-            snum = self.stations[key].get('number')
+        enc, names_first, chan_ids = self.enc, self.channelNamesFirst, self.channel_ids()
+        out = []
+        app = out.append
+        for key in self.sorted_stations():
+            station = self.stations[key]
+            sname = enc(station.get('name'))
+            fname = enc(station.get('fullname'))
+            snum = station.get('number')
             
-            fh.write('\t<channel id="{}">\n'.format(self.station_to_channel(key)))
+            app('\t<channel id="{}">\n'.format(chan_ids[key]))
             
-            if hasattr(self, 'channelNamesFirst') and self.channelNamesFirst and sname:
-                fh.write('\t\t<display-name>{}</display-name>\n'.format(sname))
+            if names_first and sname:
+                app('\t\t<display-name>{}</display-name>\n'.format(sname))
                 
             if snum:
                 self.copy_logo(key)
                 if snum:
-                    fh.write('\t\t<display-name>{} {}</display-name>\n'.format(snum, sname))
-                    fh.write('\t\t<display-name>{}</display-name>\n'.format(snum))
+                    app('\t\t<display-name>{} {}</display-name>\n'.format(snum, sname))
+                    app('\t\t<display-name>{}</display-name>\n'.format(snum))
                     
-            if not hasattr(self, 'channelNamesFirst') or not self.channelNamesFirst:
+            if not names_first:
                 if sname:
-                    fh.write('\t\t<display-name>{}</display-name>\n'.format(sname))
+                    app('\t\t<display-name>{}</display-name>\n'.format(sname))
                     
             if fname:
-                fh.write('\t\t<display-name>{}</display-name>\n'.format(fname))
+                app('\t\t<display-name>{}</display-name>\n'.format(fname))
                 
-            if 'logoURL' in self.stations[key]:
-                fh.write('\t\t<icon src="{}" />\n'.format(self.stations[key]['logoURL']))
+            logo = station.get('logoURL')
+            if logo is not None:
+                app('\t\t<icon src="{}" />\n'.format(logo))
                 
-            fh.write('\t</channel>\n')
+            app('\t</channel>\n')
+        fh.write(''.join(out))
 
     def print_programmes(self, fh):
-        for station in sorted(self.schedule.keys(), key=cmp_to_key(self.sort_chan)):
-            i = 0
+        schedule, programs = self.schedule, self.programs
+        lang, conv_time, tz_str = self.lang, self.conv_time, self.get_timezone_offset_str
+        chan_ids, programme_xml = self.channel_ids(), self.programme_xml
+        slot_tags = SLOT_NEW | SLOT_CC | (SLOT_LIVE if self.liveTag else 0)
+        asterisk = self.asteriskFlags
+        for station in self.sorted_stations():
+            if station not in schedule:
+                continue
+            slots = schedule[station]
             # Keep original keys exactly as they are
-            original_keys = list(self.schedule[station].keys())
+            original_keys = list(slots.keys())
 
             # Sort keys by the 'time' field of their associated dict
-            key_array = sorted(original_keys, key=lambda k: self.schedule[station][k]['time'])
-
-            while i < len(key_array):
+            key_array = sorted(original_keys, key=lambda k: slots[k]['time'])
+
+            # Collect the station's programmes and write them in one go
+            out = []
+            app = out.append
+            # The last slot only marks where its predecessor ends unless it has an end time
+            count = len(key_array)
+            if count and 'endtime' not in slots[key_array[-1]]:
+                count -= 1
+            end_time = stop_time = stop_tz = None
+            for i in range(count):
                 s = key_array[i]  # s is the original key (str or int or whatever)
 
-                # Remove last key if no 'endtime'
-                if i == len(key_array) - 1 and 'endtime' not in self.schedule[station][s]:
-                    del self.schedule[station][s]
-                    i += 1
-                    continue
-
-                p = self.schedule[station][s]['program']
-                start_time = self.conv_time(self.schedule[station][s]['time'])
-                start_tz = self.get_timezone_offset_str(self.schedule[station][s]['time'])
-
-                if 'endtime' in self.schedule[station][s]:
-                    end_time = self.schedule[station][s]['endtime']
+                sched = slots[s]
+                p = sched['program']
+                prog = programs[p]
+                # Back-to-back programmes: this start is the previous stop
+                if sched['time'] == end_time:
+                    start_time, start_tz = stop_time, stop_tz
                 else:
-                    end_time = self.schedule[station][key_array[i+1]]['time']
+                    start_time = conv_time(sched['time'])
+                    start_tz = tz_str(sched['time'])
+
+                end_time = sched.get('endtime')
+                if end_time is None:
+                    end_time = slots[key_array[i+1]]['time']
 
-                stop_time = self.conv_time(end_time)
-                stop_tz = self.get_timezone_offset_str(end_time)
+                stop_time = conv_time(end_time)
+                stop_tz = tz_str(end_time)
 
-                fh.write('\t<programme start="{} {}" stop="{} {}" channel="{}">\n'.format(
+                app('\t<programme start="{} {}" stop="{} {}" channel="{}">\n'.format(
                     start_time, start_tz, stop_time, stop_tz, 
-                    self.station_to_channel(self.schedule[station][s]['station'])))
-
-                if 'title' in self.programs[p]:
-                    title = self.enc(self.programs[p]['title'])
-                    title = self.append_asterisk(title, station, s)
-                    fh.write('\t\t<title lang="{}">{}</title>\n'.format(self.lang, title))
-
-                if 'episode' in self.programs[p] or (hasattr(self, 'movieSubtitle') and self.movieSubtitle and 'movie_year' in self.programs[p]):
-                    fh.write('\t\t<sub-title lang="{}">'.format(self.lang))
-                    if 'episode' in self.programs[p]:
-                        fh.write(self.enc(self.programs[p]['episode']))
-                    elif 'movie_year' in self.programs[p]:
-                        fh.write("Movie ({})".format(self.programs[p]['movie_year']))
-                    fh.write('</sub-title>\n')
-
-                if 'description' in self.programs[p]:
-                    fh.write('\t\t<desc lang="{}">{}</desc>\n'.format(
-                        self.lang, self.enc(self.programs[p]['description'])))
-
-                if ('actor' in self.programs[p] or 'director' in self.programs[p] or 
-                    'writer' in self.programs[p] or 'producer' in self.programs[p] or 
-                    'presenter' in self.programs[p]):
-                    fh.write('\t\t<credits>\n')
-                    self.print_credits(fh, p, "director")
-
-                    if 'actor' in self.programs[p]:
-                        for g in sorted(self.programs[p]['actor'].keys(), 
-                                    key=lambda x: self.programs[p]['actor'][x]):
-                            fh.write('\t\t\t<actor')
-                            if 'role' in self.programs[p] and g in self.programs[p]['role']:
-                                fh.write(' role="{}"'.format(self.enc(self.programs[p]['role'][g])))
-                            fh.write('>{}</actor>\n'.format(self.enc(g)))
-
-                    self.print_credits(fh, p, "writer")
-                    self.print_credits(fh, p, "producer")
-                    self.print_credits(fh, p, "presenter")
-                    fh.write('\t\t</credits>\n')
-
-                date = None
-                if 'movie_year' in self.programs[p]:
-                    date = self.programs[p]['movie_year']
-                elif 'originalAirDate' in self.programs[p] and p.startswith(('EP', 'SH')):
-                    date = self.conv_oad(self.programs[p]['originalAirDate'])
-
-                if date:
-                    fh.write('\t\t<date>{}</date>\n'.format(date))
-
-                if 'genres' in self.programs[p]:
-                    for g in sorted(self.programs[p]['genres'].keys(), 
-                                key=lambda x: (self.programs[p]['genres'][x], x)):
-                        fh.write('\t\t<category lang="{}">{}</category>\n'.format(
-                            self.lang, self.enc(g.capitalize())))
-
-                if 'duration' in self.programs[p]:
-                    fh.write('\t\t<length units="minutes">{}</length>\n'.format(
-                        self.programs[p]['duration']))
-
-                if 'imageUrl' in self.programs[p]:
-                    fh.write('\t\t<icon src="{}" />\n'.format(
-                        self.enc(self.programs[p]['imageUrl'])))
-
-                if 'url' in self.programs[p]:
-                    fh.write('\t\t<url>{}</url>\n'.format(
-                        self.enc(self.programs[p]['url'])))
-
-                xs = None
-                xe = None
-
-                if 'seasonNum' in self.programs[p] and 'episodeNum' in self.programs[p]:
-                    s_num = self.programs[p]['seasonNum']
-                    sf = "S{:0{}d}".format(int(s_num), max(2, len(str(s_num))))
-                    e_num = self.programs[p]['episodeNum']
-                    ef = "E{:0{}d}".format(int(e_num), max(2, len(str(e_num))))
-
-                    xs = int(s_num) - 1
-                    xe = int(e_num) - 1
-
-                    if int(s_num) > 0 or int(e_num) > 0:
-                        fh.write('\t\t<episode-num system="common">{}{}</episode-num>\n'.format(sf, ef))
-
-                # DD Prog ID
-                if re.match(r'^..\d{8}\d{4}', p):
-                    dd_prog_id = "{}.{}".format(p[:10], p[10:14])
-                    fh.write('\t\t<episode-num system="dd_progid">{}</episode-num>\n'.format(dd_prog_id))
-
-                if xs is not None and xe is not None and xs >= 0 and xe >= 0:
-                    fh.write('\t\t<episode-num system="xmltv_ns">{}.{}.</episode-num>\n'.format(xs, xe))
-
-                if 'quality' in self.schedule[station][s]:
-                    fh.write('\t\t<video>\n')
-                    fh.write('\t\t\t<aspect>16:9</aspect>\n')
-                    fh.write('\t\t\t<quality>HDTV</quality>\n')
-                    fh.write('\t\t</video>\n')
-
-                new = 'new' in self.schedule[station][s]
-                live = 'live' in self.schedule[station][s]
-                cc = 'cc' in self.schedule[station][s]
-
-                if not new and not live and (p.startswith('EP') or p.startswith('SH') or re.match(r'^\d', p)):
-                    fh.write('\t\t<previously-shown ')
-                    if 'originalAirDate' in self.programs[p]:
-                        date = self.conv_oad(self.programs[p]['originalAirDate'])
-                        fh.write('start="{}000000" '.format(date))
-                    fh.write('/>\n')
-
-                if 'premiere' in self.schedule[station][s]:
-                    fh.write('\t\t<premiere>{}</premiere>\n'.format(
-                        self.schedule[station][s]['premiere']))
-
-                if 'finale' in self.schedule[station][s]:
-                    fh.write('\t\t<last-chance>{}</last-chance>\n'.format(
-                        self.schedule[station][s]['finale']))
-
-                if new:
-                    fh.write('\t\t<new />\n')
-
-                if hasattr(self, 'liveTag') and self.liveTag and live:
-                    fh.write('\t\t<live />\n')
-
-                if cc:
-                    fh.write('\t\t<subtitles type="teletext" />\n')
-
-                if 'rating' in self.programs[p]:
-                    fh.write('\t\t<rating>\n\t\t\t<value>{}</value>\n\t\t</rating>\n'.format(
-                        self.programs[p]['rating']))
-
-                if 'starRating' in self.programs[p]:
-                    fh.write('\t\t<star-rating>\n\t\t\t<value>{}/4</value>\n\t\t</star-rating>\n'.format(
-                        self.programs[p]['starRating']))
-
-                fh.write('\t</programme>\n')
-                i += 1
+                    chan_ids[sched['station']]))
+
+                flags = sched['flags']
+                title, body, prev, ratings = programme_xml(p, prog)
+                if title is not None:
+                    if flags & asterisk:
+                        app('\t\t<title lang="{}">{} *</title>\n'.format(lang, title))
+                    else:
+                        app('\t\t<title lang="{}">{}</title>\n'.format(lang, title))
+                app(body)
+
+                if flags & SLOT_HD:
+                    app('\t\t<video>\n\t\t\t<aspect>16:9</aspect>\n\t\t\t<quality>HDTV</quality>\n\t\t</video>\n')
+
+                if prev and not flags & (SLOT_NEW | SLOT_LIVE):
+                    app(prev)
+
+                premiere = sched.get('premiere')
+                if premiere is not None:
+                    app('\t\t<premiere>{}</premiere>\n'.format(premiere))
+
+                finale = sched.get('finale')
+                if finale is not None:
+                    app('\t\t<last-chance>{}</last-chance>\n'.format(finale))
 
-    def print_credits(self, fh, p, role):
-        if role in self.programs[p]:
-            for g in sorted(self.programs[p][role].keys(), 
-                           key=lambda x: self.programs[p][role][x]):
-                fh.write('\t\t\t<{}>{}</{}>\n'.format(
+                if flags & slot_tags:
+                    app(SLOT_TAGS[flags & slot_tags])
+
+                app(ratings)
+                app('\t</programme>\n')
+            fh.write(''.join(out))
+
+    def programme_xml(self, p, prog):
+        """
+        Returns the (title, body, previously-shown, ratings) parts of a <programme>
+        that depend only on the program. Programs air many times, so each is
+        encoded once. title is None when the program has none; prev is '' when
+        the program is never marked as previously shown.
+        """
+        parts = self.programmeXml.get(p)
+        if parts is not None:
+            return parts
+        enc, lang = self.enc, self.lang
+        title = enc(prog['title']) if 'title' in prog else None
+
+        get = prog.get
+        episode = get('episode')
+        movie_year = get('movie_year')
+        oad = get('originalAirDate')
+
+        out = []
+        app = out.append
+        if episode is not None:
+            app('\t\t<sub-title lang="{}">{}</sub-title>\n'.format(lang, enc(episode)))
+        elif self.movieSubtitle and movie_year is not None:
+            app('\t\t<sub-title lang="{}">Movie ({})</sub-title>\n'.format(lang, movie_year))
+
+        description = get('description')
+        if description is not None:
+            app('\t\t<desc lang="{}">{}</desc>\n'.format(lang, enc(description)))
+
+        if ('actor' in prog or 'director' in prog or 
+            'writer' in prog or 'producer' in prog or 
+            'presenter' in prog):
+            app('\t\t<credits>\n')
+            self.print_credits(app, prog, "director")
+
+            actors = get('actor')
+            if actors is not None:
+                roles = get('role', {})
+                for g, _ in sorted(actors.items(), key=itemgetter(1)):
+                    if g in roles:
+                        app('\t\t\t<actor role="{}">{}</actor>\n'.format(
+                            enc(roles[g]), enc(g)))
+                    else:
+                        app('\t\t\t<actor>{}</actor>\n'.format(enc(g)))
+
+            self.print_credits(app, prog, "writer")
+            self.print_credits(app, prog, "producer")
+            self.print_credits(app, prog, "presenter")
+            app('\t\t</credits>\n')
+
+        date = None
+        if movie_year is not None:
+            date = movie_year
+        elif oad is not None and p.startswith(('EP', 'SH')):
+            date = self.conv_oad(oad)
+
+        if date:
+            app('\t\t<date>{}</date>\n'.format(date))
+
+        genres = get('genres')
+        if genres is not None:
+            for g in sorted(genres.keys(), key=lambda x: (genres[x], x)):
+                app('\t\t<category lang="{}">{}</category>\n'.format(
+                    lang, enc(g.capitalize())))
+
+        duration = get('duration')
+        if duration is not None:
+            app('\t\t<length units="minutes">{}</length>\n'.format(duration))
+
+        image = get('imageUrl')
+        if image is not None:
+            app('\t\t<icon src="{}" />\n'.format(enc(image)))
+
+        url = get('url')
+        if url is not None:
+            app('\t\t<url>{}</url>\n'.format(enc(url)))
+
+        s_raw = get('seasonNum')
+        e_raw = get('episodeNum')
+        numbered = s_raw is not None and e_raw is not None
+        if numbered:
+            # Gracenote gives strings, tvguide ints; convert each once
+            s_num = int(s_raw)
+            e_num = int(e_raw)
+            if s_num > 0 or e_num > 0:
+                # At least two digits, wider if the source number was
+                sw = max(2, len(str(s_raw)))
+                ew = max(2, len(str(e_raw)))
+                app(f'\t\t<episode-num system="common">S{s_num:0{sw}d}E{e_num:0{ew}d}</episode-num>\n')
+
+        # DD Prog ID
+        if len(p) >= 14 and p[2:14].isdecimal():
+            app(f'\t\t<episode-num system="dd_progid">{p[:10]}.{p[10:14]}</episode-num>\n')
+
+        if numbered and s_num > 0 and e_num > 0:
+            app(f'\t\t<episode-num system="xmltv_ns">{s_num - 1}.{e_num - 1}.</episode-num>\n')
+        body = ''.join(out)
+
+        prev = ''
+        if p.startswith(('EP', 'SH')) or p[:1].isdecimal():
+            if oad is not None:
+                prev = '\t\t<previously-shown start="{}000000" />\n'.format(self.conv_oad(oad))
+            else:
+                prev = '\t\t<previously-shown />\n'
+
+        ratings = ''
+        rating = get('rating')
+        if rating is not None:
+            ratings += '\t\t<rating>\n\t\t\t<value>{}</value>\n\t\t</rating>\n'.format(rating)
+
+        star_rating = get('starRating')
+        if star_rating is not None:
+            ratings += '\t\t<star-rating>\n\t\t\t<value>{}/4</value>\n\t\t</star-rating>\n'.format(star_rating)
+
+        parts = self.programmeXml[p] = (title, body, prev, ratings)
+        return parts
+
+    def print_credits(self, app, prog, role):
+        if role in prog:
+            for g, _ in sorted(prog[role].items(), key=itemgetter(1)):
+                app('\t\t\t<{}>{}</{}>\n'.format(
                     role, self.enc(g), role))
 
     def print_header_xtvd(self, fh, enc):
@@ -1625,116 +1994,144 @@ class Zap2XML:
         fh.write("</xtvd>\n")
 
     def print_stations_xtvd(self, fh):
-        fh.write("<stations>\n")
-        for key in sorted(self.stations.keys(), key=cmp_to_key(self.sort_chan)):
-            fh.write("\t<station id='{}'>\n".format(self.stations[key]['stnNum']))
-            if 'number' in self.stations[key]:
-                sname = self.enc(self.stations[key]['name'])
-                fh.write("\t\t<callSign>{}</callSign>\n".format(sname))
-                fh.write("\t\t<name>{}</name>\n".format(sname))
-                fh.write("\t\t<fccChannelNumber>{}</fccChannelNumber>\n".format(
-                    self.stations[key]['number']))
+        fh.writelines(self.iter_stations_xtvd())
+
+    def iter_stations_xtvd(self):
+        yield "<stations>\n"
+        for key in self.sorted_stations():
+            station = self.stations[key]
+            yield "\t<station id='{}'>\n".format(station['stnNum'])
+            if 'number' in station:
+                sname = self.enc(station['name'])
+                yield "\t\t<callSign>{}</callSign>\n\t\t<name>{}</name>\n".format(sname, sname)
+                yield "\t\t<fccChannelNumber>{}</fccChannelNumber>\n".format(station['number'])
                 self.copy_logo(key)
-            fh.write("\t</station>\n")
-        fh.write("</stations>\n")
+            yield "\t</station>\n"
+        yield "</stations>\n"
 
     def print_lineups_xtvd(self, fh):
-        fh.write("<lineups>\n")
-        fh.write("\t<lineup id='{}' name='{}' location='{}' type='{}' postalCode='{}'>\n".format(
+        out = []
+        app = out.append
+        app("<lineups>\n")
+        app("\t<lineup id='{}' name='{}' location='{}' type='{}' postalCode='{}'>\n".format(
             self.lineupId, self.lineupname, self.lineuplocation, 
             self.lineuptype, self.postalcode))
-        for key in sorted(self.stations.keys(), key=cmp_to_key(self.sort_chan)):
+        for key in self.sorted_stations():
             if 'number' in self.stations[key]:
-                fh.write("\t<map station='{}' channel='{}'></map>\n".format(
+                app("\t<map station='{}' channel='{}'></map>\n".format(
                     self.stations[key]['stnNum'], self.stations[key]['number']))
-        fh.write("\t</lineup>\n")
-        fh.write("</lineups>\n")
+        app("\t</lineup>\n")
+        app("</lineups>\n")
+        fh.write(''.join(out))
 
     def print_schedules_xtvd(self, fh):
+        conv_time, conv_duration = self.conv_time_xtvd, self.conv_duration_xtvd
         fh.write("<schedules>\n")
-        for station in sorted(self.schedule.keys(), key=cmp_to_key(self.sort_chan)):
-            i = 0
-            key_array = sorted(self.schedule[station].keys())
+        for station in self.sorted_stations():
+            if station not in self.schedule:
+                continue
+            slots = self.schedule[station]
+            stn_num = self.stations[station]['stnNum']
+            key_array = sorted(slots.keys())
             
-            while i < len(key_array):
+            # The last slot only marks where its predecessor ends
+            out = []
+            app = out.append
+            for i in range(len(key_array) - 1):
                 s = key_array[i]
-                if i == len(key_array) - 1:
-                    del self.schedule[station][s]
-                    continue
-                    
-                p = self.schedule[station][s]['program']
-                start_time = self.conv_time_xtvd(self.schedule[station][s]['time'])
-                stop_time = self.conv_time_xtvd(self.schedule[station][key_array[i+1]]['time'])
-                duration = self.conv_duration_xtvd(
-                    self.schedule[station][key_array[i+1]]['time'] - self.schedule[station][s]['time'])
+                sched = slots[s]
+                p = sched['program']
+                next_time = slots[key_array[i+1]]['time']
+                start_time = conv_time(sched['time'])
+                stop_time = conv_time(next_time)
+                duration = conv_duration(next_time - sched['time'])
                 
-                fh.write("\t<schedule program='{}' station='{}' time='{}' duration='{}'".format(
-                    p, self.stations[station]['stnNum'], start_time, duration))
+                app("\t<schedule program='{}' station='{}' time='{}' duration='{}'".format(
+                    p, stn_num, start_time, duration))
                 
-                if 'quality' in self.schedule[station][s]:
-                    fh.write(" hdtv='true'")
-                if 'new' in self.schedule[station][s] or 'live' in self.schedule[station][s]:
-                    fh.write(" new='true'")
-                fh.write("/>\n")
-                i += 1
+                if sched['flags'] & SLOT_HD:
+                    app(" hdtv='true'")
+                if sched['flags'] & (SLOT_NEW | SLOT_LIVE):
+                    app(" new='true'")
+                app("/>\n")
+            fh.write(''.join(out))
         fh.write("</schedules>\n")
 
     def print_programs_xtvd(self, fh):
-        fh.write("<programs>\n")
-        for p in self.programs:
-            fh.write("\t<program id='{}'>\n".format(p))
-            if 'title' in self.programs[p]:
-                fh.write("\t\t<title>{}</title>\n".format(
-                    self.enc(self.programs[p]['title'])))
-            if 'episode' in self.programs[p]:
-                fh.write("\t\t<subtitle>{}</subtitle>\n".format(
-                    self.enc(self.programs[p]['episode'])))
-            if 'description' in self.programs[p]:
-                fh.write("\t\t<description>{}</description>\n".format(
-                    self.enc(self.programs[p]['description'])))
+        fh.writelines(self.iter_programs_xtvd())
+
+    def iter_programs_xtvd(self):
+        enc, conv_oad = self.enc, self.conv_oad_xtvd
+        yield "<programs>\n"
+        for p, prog in self.programs.items():
+            get = prog.get
+            yield "\t<program id='{}'>\n".format(p)
+            title = get('title')
+            if 'title' in prog:
+                yield "\t\t<title>{}</title>\n".format(enc(title))
+            episode = get('episode')
+            if episode is not None:
+                yield "\t\t<subtitle>{}</subtitle>\n".format(enc(episode))
+            description = get('description')
+            if description is not None:
+                yield "\t\t<description>{}</description>\n".format(enc(description))
                     
-            if 'movie_year' in self.programs[p]:
-                fh.write("\t\t<year>{}</year>\n".format(
-                    self.programs[p]['movie_year']))
+            movie_year = get('movie_year')
+            if movie_year is not None:
+                yield "\t\t<year>{}</year>\n".format(movie_year)
             else:
                 show_type = "Series"
-                if 'title' in self.programs[p] and "Paid Programming" in self.programs[p]['title']:
+                if title and "Paid Programming" in title:
                     show_type = "Paid Programming"
-                fh.write("\t\t<showType>{}</showType>\n".format(show_type))
-                fh.write("\t\t<series>EP{}</series>\n".format(p[2:10]))
-                if 'originalAirDate' in self.programs[p]:
-                    fh.write("\t\t<originalAirDate>{}</originalAirDate>\n".format(
-                        self.conv_oad_xtvd(self.programs[p]['originalAirDate'])))
-            fh.write("\t</program>\n")
-        fh.write("</programs>\n")
+                yield "\t\t<showType>{}</showType>\n\t\t<series>EP{}</series>\n".format(show_type, p[2:10])
+                oad = get('originalAirDate')
+                if oad is not None:
+                    yield "\t\t<originalAirDate>{}</originalAirDate>\n".format(conv_oad(oad))
+            yield "\t</program>\n"
+        yield "</programs>\n"
 
     def print_genres_xtvd(self, fh):
-        fh.write("<genres>\n")
-        for p in self.programs:
-            if 'genres' in self.programs[p] and 'movie' not in self.programs[p]['genres']:
-                fh.write("\t<programGenre program='{}'>\n".format(p))
-                for g in self.programs[p]['genres']:
-                    fh.write("\t\t<genre>\n")
-                    fh.write("\t\t\t<class>{}</class>\n".format(
-                        self.enc(g.capitalize())))
-                    fh.write("\t\t\t<relevance>0</relevance>\n")
-                    fh.write("\t\t</genre>\n")
-                fh.write("\t</programGenre>\n")
-        fh.write("</genres>\n")
+        fh.writelines(self.iter_genres_xtvd())
+
+    def iter_genres_xtvd(self):
+        enc = self.enc
+        yield "<genres>\n"
+        for p, prog in self.programs.items():
+            genres = prog.get('genres')
+            if genres is not None and 'movie' not in genres:
+                yield "\t<programGenre program='{}'>\n".format(p)
+                for g in genres:
+                    yield "\t\t<genre>\n\t\t\t<class>{}</class>\n\t\t\t<relevance>0</relevance>\n\t\t</genre>\n".format(
+                        enc(g.capitalize()))
+                yield "\t</programGenre>\n"
+        yield "</genres>\n"
 
     def inc_xml(self, fh, start_tag, end_tag):
+        """
+        Copies the lines of the -i file from each line containing start_tag up to,
+        but not including, the next line containing end_tag.
+        """
         try:
             with open(self.includeXMLTV, 'r') as xf:
-                in_section = False
-                for line in xf:
-                    if start_tag in line:
-                        in_section = True
-                    if in_section and end_tag not in line:
-                        fh.write(line)
-                    if end_tag in line:
-                        in_section = False
+                data = xf.read()
         except IOError as e:
             self.perr(f"Error including XML file: {e}\n")
+            return
+
+        pos = 0
+        while True:
+            start = data.find(start_tag, pos)
+            if start < 0:
+                break
+            start = data.rfind('\n', 0, start) + 1
+            end = data.find(end_tag, start)
+            if end < 0:
+                fh.write(data[start:])
+                break
+            fh.write(data[start:data.rfind('\n', 0, end) + 1])
+            pos = data.find('\n', end) + 1
+            if not pos:
+                break
 
     def help_message(self):
         help_text = f"""
@@ -1768,6 +2165,7 @@ zap2xml <zap2xml@gmail.com> ({VERSION})
   -P <http://proxyhost:port> = to use an http proxy
   -C <configuration file> (default = "{os.path.join(self.homeDir, '.zap2xmlrc')}")
   -S <#seconds> = sleep between requests to prevent flooding of server 
+  -t <# of parallel downloads> (default = {DEFAULT_WORKERS}, 1 when -S is used)
   -D = include details = 1 extra http request per program!
   -I = include icons (image URLs) - 1 extra http request per program!
   -J <xmltv> = include xmltv file in output